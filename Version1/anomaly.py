@@ -0,0 +1,62 @@
+"""Online latency anomaly detection per device.
+
+Each device keeps an exponentially weighted moving mean and variance of its
+response time: three floats and a counter, updated in O(1) per probe. A
+probe is anomalous when it is more than `threshold` standard deviations
+(and at least min_deviation_ms) slower than the baseline. Because the
+baseline keeps adapting, a lasting shift stops being flagged after a while.
+"""
+import math
+
+
+class LatencyPolicy:
+    """Detector settings shared by all devices."""
+
+    def __init__(self, alpha=0.1, threshold=3.0, warmup=10, min_deviation_ms=10):
+        # Weight of the newest sample; 0.1 remembers roughly the last 20 probes
+        self.alpha = alpha
+        self.threshold = threshold
+        # Probes needed before the baseline is trusted
+        self.warmup = warmup
+        self.min_deviation_ms = min_deviation_ms
+
+
+class LatencyDetector:
+    """EWMA baseline of one device's response time."""
+    __slots__ = ('policy', 'mean', 'variance', 'count', 'score', 'anomalous')
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+        self.score = 0.0
+        self.anomalous = False
+
+    def observe(self, value):
+        """Feeds one response time in ms; returns True if it is an anomaly."""
+        policy = self.policy
+        if self.count == 0:
+            self.mean = value
+        deviation = value - self.mean
+        stddev = math.sqrt(self.variance)
+        self.score = deviation / stddev if stddev > 0 else 0.0
+        self.anomalous = (
+            self.count >= policy.warmup
+            and deviation >= policy.min_deviation_ms
+            and deviation > policy.threshold * stddev
+        )
+        increment = policy.alpha * deviation
+        self.mean += increment
+        self.variance = (1 - policy.alpha) * (self.variance + deviation * increment)
+        self.count += 1
+        return self.anomalous
+
+    def summary(self):
+        return {
+            "baseline_ms": round(self.mean, 2),
+            "stddev_ms": round(math.sqrt(self.variance), 2),
+            "score": round(self.score, 2),
+            "anomaly": self.anomalous,
+            "samples": self.count
+        }
@@ -1,19 +1,50 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, g, has_request_context, jsonify, render_template, request
 from flask_httpauth import HTTPBasicAuth
 from werkzeug.security import generate_password_hash, check_password_hash
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.events import EVENT_JOB_MISSED
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import paramiko
-import socket
 import json
+import hmac
+import atexit
 import time
-from collections import deque
 from functools import wraps
+from contextlib import contextmanager
 import os
 import logging
+import threading
+import gzip
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from pytz import UnknownTimeZoneError
+from journal import UpdateJournal
+from jobstore import SQLiteJobStore
+from metrics import registry
+from profiler import SlowRequestProfiler
+from columnar import COLUMNAR_MIMETYPE, encode_uptime, encode_uptime_msgpack
+import probes
+from history import UptimeHistory, load_histories, save_histories
+from status import StatusPolicy, StatusTracker
+from anomaly import LatencyDetector, LatencyPolicy
+from sketch import SketchSeries
+from notifications import NotificationQueue
+from config_watch import STATE_FIELDS, ConfigWatcher, connection_changed, diff_devices, validate_config
+from tags import SelectorError, TagIndex
+
+# Optional brotli compression, gzip is used when it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Optional MessagePack output for the uptime endpoints
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -22,8 +53,50 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 auth = HTTPBasicAuth()
 
+# Metrics for the hot paths, exposed at /metrics
+ssh_phase_seconds = registry.histogram(
+    'dashboard_ssh_phase_seconds', 'SSH time per phase: tcp connect, key exchange, auth, command exec', ['phase'])
+ssh_failures = registry.counter('dashboard_ssh_failures', 'Failed SSH commands', ['error'])
+sweep_seconds = registry.histogram('dashboard_sweep_duration_seconds', 'Duration of a monitoring sweep')
+devices_by_status = registry.gauge('dashboard_devices', 'Devices per status after the last sweep', ['status'])
+status_transitions = registry.counter('dashboard_status_transitions', 'Device status changes by new status', ['status'])
+smtp_seconds = registry.histogram('dashboard_smtp_send_seconds', 'Time spent sending one email')
+emails_sent = registry.counter('dashboard_emails', 'Emails by result', ['result'])
+notifications_queued = registry.counter('dashboard_notifications', 'Notifications queued by priority', ['priority'])
+auth_seconds = registry.histogram('dashboard_auth_check_seconds', 'Password hash verification time')
+storage_write_seconds = registry.histogram(
+    'dashboard_storage_write_seconds', 'Time to write persistent state', ['store'])
+http_seconds = registry.histogram(
+    'dashboard_http_request_duration_seconds', 'Request latency per route', ['route', 'method', 'status'])
+
+# Time spent per phase of the current request, reported in the Server-Timing header
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            timings = g.setdefault('phase_timings', {})
+            timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
+CONFIG_PATH = 'config/config.json'
+
+# Duration in ms and time of the last write per store, for /api/ready
+last_storage_writes = {}
+
+@contextmanager
+def timed_write(store):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        storage_write_seconds.labels(store).observe(seconds)
+        last_storage_writes[store] = (round(seconds * 1000, 2), time.time())
+
 def load_config():
-    with open('config/config.json', 'r') as f:
+    with open(CONFIG_PATH, 'r') as f:
         return json.load(f)
 
 config = load_config()
@@ -34,134 +107,812 @@ app.config['SMTP_PORT'] = config['smtp']['port']
 app.config['SMTP_USERNAME'] = config['smtp']['username']
 app.config['SMTP_PASSWORD'] = config['smtp']['password']
 
-# Authentication setup
-users = {user: generate_password_hash(password) for user, password in config['users'].items()}
+# Requests slower than the threshold get their stacks sampled into profiles/
+profiling_config = config.get('profiling', {})
+slow_request_profiler = SlowRequestProfiler(
+    threshold=profiling_config.get('slow_request_ms', 1000) / 1000,
+    interval=profiling_config.get('sample_interval_ms', 10) / 1000,
+    output_dir=profiling_config.get('output_dir', 'profiles')
+)
+
+# Authentication setup. Password hashes are computed on a user's first login;
+# hashing every user here held up startup by a quarter second per user.
+users = {}
+
+def password_hash(username):
+    """Hash of the user's configured password, None for unknown users."""
+    hashed = users.get(username)
+    if hashed is None:
+        password = config['users'].get(username)
+        if password is None:
+            return None
+        hashed = users[username] = generate_password_hash(password)
+    return hashed
 
 # Client configuration from config file
 clients = config['devices']
+# 'status' in config.json is optional; devices start out unknown
+for client in clients:
+    for server in client['servers']:
+        server.setdefault('status', 'unknown')
+
+# Initialize scheduler. Update jobs live in a SQLite job store so they survive
+# restarts; the monitoring job is re-created on every start and stays in memory.
+scheduler_config = config.get('scheduler', {})
+job_store = SQLiteJobStore(scheduler_config.get('job_store', 'config/jobs.sqlite'))
+scheduler = BackgroundScheduler(
+    jobstores={'default': job_store, 'memory': MemoryJobStore()},
+    job_defaults={
+        # Jobs that missed their run time by less than this still run after a restart
+        'misfire_grace_time': scheduler_config.get('misfire_grace_seconds', 3600),
+        # Several missed runs of the same job collapse into one
+        'coalesce': scheduler_config.get('coalesce', True),
+        'max_instances': 1
+    }
+)
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
+# Update execution settings
+updates_config = config.get('updates', {})
+UPDATE_PARALLELISM = updates_config.get('max_parallel', 16)
+RECURRING_GROUP_WINDOW = updates_config.get('recurring_group_window_seconds', 120)
+
+# Devices are probed by this process ('local') or by probe workers that push
+# their results to the ingest API ('remote', see probe_worker.py)
+probes_config = config.get('probes', {})
+PROBE_MODE = probes_config.get('mode', 'local')
+PROBE_INTERVAL = probes_config.get('interval_seconds', 300)
+INGEST_TOKEN = probes_config.get('ingest_token')
+# Workers that haven't sent a heartbeat for this long lose their shard
+WORKER_TIMEOUT = probes_config.get('worker_timeout_seconds', 3 * PROBE_INTERVAL)
+
+# Transport for SSH commands: paramiko in the calling thread (default),
+# paramiko in worker processes with their own connection pools
+# ("executor": "process"; they are forked here, before any other thread
+# starts) or asyncssh on one event loop ("transport": "asyncssh"). Host keys
+# are checked against known_hosts: a new host's first key is recorded
+# ("tofu") or refused ("strict"), a changed key always fails the connection.
+ssh_transport = probes.create_transport(
+    probes_config.get('transport', 'paramiko'),
+    executor=probes_config.get('executor', 'inline'),
+    processes=probes_config.get('processes'),
+    threads_per_process=probes_config.get('threads_per_process', 4),
+    max_idle=probes_config.get('connection_max_idle_seconds', 2 * PROBE_INTERVAL),
+    concurrency=probes_config.get('concurrency', 500),
+    known_hosts=probes_config.get('known_hosts', 'config/known_hosts'),
+    host_key_policy=probes_config.get('host_key_policy', 'tofu'),
+    task_timeout=probes_config.get('task_timeout_seconds', 120)
+)
 
 # Data storage
 scheduled_updates = []
 tickets = []
 update_history = []
 
+# Request handlers never read the live (mutable) state above. Writers publish
+# an immutable copy after each change or sweep and readers grab the current
+# one with a single dict lookup, so no locking is needed on the read side.
+class Snapshot:
+    """Published copy of one state collection with its encoded JSON cached."""
+    __slots__ = ('version', 'data', '_json', '_compressed')
+
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+        self._json = None
+        self._compressed = {}
+
+    def json_bytes(self):
+        # Two threads may both encode the first time; the result is identical
+        if self._json is None:
+            with timed_phase('serialize'):
+                self._json = json.dumps(self.data, separators=(',', ':')).encode()
+        return self._json
+
+    def compressed(self, encoding):
+        body = self._compressed.get(encoding)
+        if body is None:
+            body = self._compressed[encoding] = compress_body(self.json_bytes(), encoding)
+        return body
+
+snapshots = {}
+publish_lock = threading.Lock()
+
+def publish(name, data):
+    """Publishes a new snapshot; data must not be mutated afterwards."""
+    with publish_lock:
+        previous = snapshots.get(name)
+        snapshots[name] = Snapshot(previous.version + 1 if previous else 1, data)
+
+def get_snapshot(name):
+    return snapshots[name]
+
+# Strong ETags come from the snapshot version, so a client that already has
+# the current version gets a 304 without anything being encoded or compressed
+def snapshot_etag(name, *variant):
+    return '-'.join([name, str(get_snapshot(name).version)] + [str(v) for v in variant])
+
+def not_modified(etag):
+    """Returns a 304 response if the client already has this ETag, else None."""
+    for suffix in ('', '-gzip', '-br'):
+        if request.if_none_match.contains(etag + suffix):
+            response = Response(status=304)
+            response.set_etag(etag + suffix)
+            return response
+    return None
+
+def snapshot_response(name):
+    etag = snapshot_etag(name)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    snapshot = get_snapshot(name)
+    body = snapshot.json_bytes()
+    encoding = negotiate_encoding() if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        # Compressed bodies are cached on the snapshot as well
+        response = Response(snapshot.compressed(encoding), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(f"{etag}-{encoding}")
+    else:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+    return response
+
+# Streaming JSON for large collections: the body is produced one entry (or one
+# page of entries) at a time, so memory per request stays constant and the
+# first bytes go out before the rest has been encoded
+def stream_json_object(items):
+    """Yields a JSON object from (key, value) pairs."""
+    separator = b'{'
+    for key, value in items:
+        yield separator + json.dumps(key).encode() + b':' + json.dumps(value, separators=(',', ':')).encode()
+        separator = b','
+    yield b'{}' if separator == b'{' else b'}'
+
+def stream_json_array(items, page_size=500):
+    """Yields a JSON array, encoding page_size items per chunk."""
+    separator = b'['
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= page_size:
+            yield separator + json.dumps(page, separators=(',', ':')).encode()[1:-1]
+            separator = b','
+            page = []
+    if page:
+        yield separator + json.dumps(page, separators=(',', ':')).encode()[1:-1]
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+def streaming_json_response(chunks, etag=None):
+    response = Response(chunks, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+    return response
+
+# Response compression. Bodies under the threshold aren't worth the CPU;
+# streamed bodies are always compressed chunk by chunk.
+compression_config = config.get('compression', {})
+COMPRESS_MIN_BYTES = compression_config.get('min_bytes', 1024)
+COMPRESS_LEVEL = compression_config.get('level', 6)
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript',
+                      COLUMNAR_MIMETYPE, 'application/msgpack')
+
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(COMPRESS_LEVEL, 11))
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+
+def compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(COMPRESS_LEVEL, 11))
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def publish_clients():
+    publish('clients', [
+        {**client, 'servers': [dict(server) for server in client['servers']]} for client in clients
+    ])
+
+# Position of each update in the published list, so a state change replaces
+# only its own entry instead of copying every update again
+published_update_positions = {}
+publish_updates_lock = threading.Lock()
+
+def publish_scheduled_updates():
+    """Publishes every update; needed when updates are added or removed."""
+    with publish_updates_lock:
+        published_update_positions.clear()
+        published_update_positions.update((update['id'], i) for i, update in enumerate(scheduled_updates))
+        publish('scheduled_updates', [dict(update) for update in scheduled_updates])
+
+def publish_scheduled_update(update):
+    """Publishes a change to one update; the other entries are shared with the previous snapshot."""
+    with publish_updates_lock:
+        position = published_update_positions.get(update['id'])
+        if position is not None:
+            data = list(get_snapshot('scheduled_updates').data)
+            data[position] = dict(update)
+            publish('scheduled_updates', data)
+            return
+    publish_scheduled_updates()
+
+def publish_tickets():
+    publish('tickets', list(tickets))
+
+def publish_update_history():
+    publish('update_history', list(update_history))
+
+def publish_uptime():
+    """Publishes the device state; callers hold state_lock.
+
+    Only histories that changed since the last publish are copied again.
+    """
+    for device in changed_histories:
+        if device in uptime_history:
+            frozen_histories[device] = uptime_history[device].frozen()
+    changed_histories.clear()
+    publish('uptime', {device: frozen_histories[device] for device in uptime_history})
+    publish('latency', {device: detector.summary() for device, detector in latency_detectors.items()})
+    # Sketch series lock themselves; readers get copies of the maps a reload changes
+    publish('sketches', {'devices': dict(device_sketches), 'clients': dict(client_sketches), 'fleet': fleet_sketches})
+
+# Scheduled updates are persisted as a snapshot plus a write-ahead journal of
+# state changes, so each change is one small append instead of a full rewrite
+update_journal = UpdateJournal(
+    'config/scheduled_updates.json',
+    'config/scheduled_updates.journal',
+    compact_after=config.get('storage', {}).get('journal_compact_after', 1000)
+)
+
 # Load scheduled updates from file if exists
 def load_scheduled_updates():
+    """Replays saved updates and reconciles them with the persistent job store.
+
+    Jobs already in the store are left alone, so a restart only touches updates
+    whose job is missing (or stale). Call this while the scheduler is started
+    but paused: all job store writes then go into a single transaction.
+    """
     global scheduled_updates
     try:
-        if os.path.exists('config/scheduled_updates.json'):
-            with open('config/scheduled_updates.json', 'r') as f:
-                scheduled_updates = json.load(f)
-                # Re-schedule all updates
-                for update in scheduled_updates:
-                    if update['status'] == 'scheduled':
-                        try:
-                            run_date = datetime.fromisoformat(update['scheduled_time'].replace('Z', '+00:00'))
-                            scheduler.add_job(
-                                execute_scheduled_update,
-                                'date',
-                                run_date=run_date,
-                                args=[update['id']],
-                                id=f"update_{update['id']}"
-                            )
-                        except ValueError as e:
-                            logger.error(f"Error scheduling update {update['id']}: {e}")
-                            update['status'] = 'failed'
+        scheduled_updates = update_journal.replay()
+        stored_job_ids = job_store.get_job_ids()
+        wanted_job_ids = set()
+        with job_store.batch():
+            for update in scheduled_updates:
+                if update['status'] not in ('scheduled', 'recurring'):
+                    continue
+                job_id = f"update_{update['id']}"
+                wanted_job_ids.add(job_id)
+                if job_id in stored_job_ids:
+                    continue
+                try:
+                    scheduler.add_job(
+                        execute_scheduled_update if update['status'] == 'scheduled' else run_recurring_update,
+                        update_trigger(update),
+                        args=[update['id']],
+                        id=job_id,
+                        replace_existing=True
+                    )
+                except ValueError as e:
+                    logger.error(f"Error scheduling update {update['id']}: {e}")
+                    journal_update(update, status='failed')
+            # Drop jobs whose update was deleted or already ran
+            for job_id in stored_job_ids - wanted_job_ids:
+                if job_id.startswith('update_'):
+                    scheduler.remove_job(job_id)
+        publish_scheduled_updates()
+        logger.info(f"Restored {len(wanted_job_ids)} scheduled update jobs "
+                    f"({len(wanted_job_ids - stored_job_ids)} re-added)")
+        # Fold the replayed journal into a fresh snapshot so the next start is cheap
+        if update_journal.entries_since_snapshot:
+            save_scheduled_updates()
     except Exception as e:
         logger.error(f"Error loading scheduled updates: {e}")
 
-# Save scheduled updates to file
+# Save scheduled updates to file (full snapshot, also compacts the journal)
 def save_scheduled_updates():
     try:
-        os.makedirs('config', exist_ok=True)
-        with open('config/scheduled_updates.json', 'w') as f:
-            json.dump(scheduled_updates, f, indent=2)
+        with timed_write('scheduled_updates'):
+            update_journal.snapshot(scheduled_updates)
     except Exception as e:
         logger.error(f"Error saving scheduled updates: {e}")
 
-# Uptime monitoring - store status checks with timestamps
+# Apply a state change to an update and append it to the journal. Items
+# appended to list fields are passed as extend={field: items}, so only the
+# new items are journaled instead of the whole list.
+def journal_update(update, extend=None, **fields):
+    positions = {}
+    for name, items in (extend or {}).items():
+        positions[name] = (len(update[name]), items)
+        # A new list: the published copy still shares the old one
+        update[name] = update[name] + items
+    update.update(fields)
+    publish_scheduled_update(update)
+    try:
+        with timed_phase('storage'), timed_write('journal'):
+            update_journal.set(update['id'], extend=positions, **fields)
+            if update_journal.needs_compaction():
+                save_scheduled_updates()
+    except Exception as e:
+        logger.error(f"Error journaling update {update['id']}: {e}")
+
+# Uptime monitoring - status as run-length intervals kept for months, plus the
+# response times of the most recent probes
+uptime_config = config.get('uptime', {})
+UPTIME_MAX_SAMPLES = uptime_config.get('max_samples', 1000)
+UPTIME_RETENTION_DAYS = uptime_config.get('retention_days', 90)
+
+def new_uptime_history():
+    return UptimeHistory(UPTIME_MAX_SAMPLES, UPTIME_RETENTION_DAYS)
+
+# Histories, status trackers and latency detectors are changed by the sweep,
+# probe workers' ingest requests, update tasks and config reloads; all of them
+# hold state_lock while they do
+state_lock = threading.RLock()
+
 uptime_history = {}
 for client in clients:
     for server in client['servers']:
-        uptime_history[server['name']] = deque(maxlen=1000)  # Store last 1000 status checks
+        uptime_history[server['name']] = new_uptime_history()
+
+# Frozen copy of each history as last published, and the devices whose
+# history changed since then
+frozen_histories = {}
+changed_histories = set(uptime_history)
+
+# Device status is debounced: it changes after several consecutive probe
+# results, and devices whose results keep changing are marked flapping
+status_config = config.get('status', {})
+status_policy = StatusPolicy(
+    down_after=status_config.get('down_after', 2),
+    up_after=status_config.get('up_after', 2),
+    flap_window=status_config.get('flap_window', 20),
+    flap_start=status_config.get('flap_start', 0.3),
+    flap_stop=status_config.get('flap_stop', 0.1)
+)
+status_trackers = {
+    server['name']: StatusTracker(status_policy) for client in clients for server in client['servers']
+}
+
+# Response times of healthy probes feed a per-device EWMA baseline that flags
+# probes much slower than usual
+latency_config = config.get('latency', {})
+latency_policy = LatencyPolicy(
+    alpha=latency_config.get('alpha', 0.1),
+    threshold=latency_config.get('threshold', 3.0),
+    warmup=latency_config.get('warmup', 10),
+    min_deviation_ms=latency_config.get('min_deviation_ms', 10)
+)
+latency_detectors = {
+    server['name']: LatencyDetector(latency_policy) for client in clients for server in client['servers']
+}
+
+# Response time percentiles: a mergeable DDSketch per device per time bucket.
+# Per-client and fleet-wide series are updated alongside, so percentiles for
+# any window merge a few bucket sketches instead of sorting raw probes.
+SKETCH_BUCKET_SECONDS = latency_config.get('sketch_bucket_minutes', 60) * 60
+SKETCH_RETENTION_SECONDS = latency_config.get('sketch_retention_hours', 72) * 3600
+SKETCH_ACCURACY = latency_config.get('sketch_relative_accuracy', 0.01)
 
-# Load uptime history from file if exists
+def new_sketch_series():
+    return SketchSeries(SKETCH_BUCKET_SECONDS, SKETCH_RETENTION_SECONDS, SKETCH_ACCURACY)
+
+device_clients = {server['name']: client['id'] for client in clients for server in client['servers']}
+device_sketches = {name: new_sketch_series() for name in device_clients}
+client_sketches = {client['id']: new_sketch_series() for client in clients}
+fleet_sketches = new_sketch_series()
+
+def record_latency(device_name, timestamp, response_time):
+    timestamp = datetime.fromisoformat(timestamp).timestamp()
+    device_sketches[device_name].add(timestamp, response_time)
+    client_sketches[device_clients[device_name]].add(timestamp, response_time)
+    fleet_sketches.add(timestamp, response_time)
+
+def response_time_percentiles(series, since_time):
+    if series is None:
+        return None
+    return series.merged(since_time.timestamp()).percentiles()
+
+def load_latency_sketches():
+    try:
+        if os.path.exists('config/latency_sketches.json'):
+            with open('config/latency_sketches.json', 'r') as f:
+                saved = json.load(f)
+            for device, buckets in saved.items():
+                if device in device_sketches:
+                    # Merged into what was recorded before the load, and only
+                    # the saved buckets go into the client and fleet series
+                    loaded = new_sketch_series()
+                    loaded.load_dict(buckets)
+                    device_sketches[device].absorb(loaded)
+                    client_sketches[device_clients[device]].absorb(loaded)
+                    fleet_sketches.absorb(loaded)
+    except Exception as e:
+        logger.error(f"Error loading latency sketches: {e}")
+
+def save_latency_sketches():
+    try:
+        os.makedirs('config', exist_ok=True)
+        with timed_write('latency_sketches'), open('config/latency_sketches.json', 'w') as f:
+            json.dump({device: series.to_dict() for device, series in device_sketches.items()},
+                      f, separators=(',', ':'))
+    except Exception as e:
+        logger.error(f"Error saving latency sketches: {e}")
+
+# Initial snapshots, replaced whenever the state changes
+publish_clients()
+publish_scheduled_updates()
+publish_tickets()
+publish_update_history()
+publish_uptime()
+
+# Load uptime history from file if exists. Each device's history is only
+# decoded when it is first used.
 def load_uptime_history():
-    global uptime_history
     try:
         if os.path.exists('config/uptime_history.json'):
-            with open('config/uptime_history.json', 'r') as f:
-                saved_history = json.load(f)
-                for device, records in saved_history.items():
-                    if device in uptime_history:
-                        uptime_history[device] = deque(records, maxlen=1000)
+            saved = load_histories('config/uptime_history.json', uptime_history.keys(),
+                                   UPTIME_MAX_SAMPLES, UPTIME_RETENTION_DAYS)
+            for device, history in saved.items():
+                # Results probe workers pushed before the load go after the saved ones
+                if uptime_history[device].intervals:
+                    uptime_history[device].prepend(history)
+                else:
+                    uptime_history[device] = history
+                changed_histories.add(device)
+        publish_uptime()
     except Exception as e:
         logger.error(f"Error loading uptime history: {e}")
 
-# Save uptime history to file
+# Save the published uptime history to file, so probe results can keep coming
+# in while it's written; histories that were never used are written back
+# without being decoded
 def save_uptime_history():
     try:
         os.makedirs('config', exist_ok=True)
-        # Convert deques to lists for JSON serialization
-        saveable_history = {}
-        for device, records in uptime_history.items():
-            saveable_history[device] = list(records)
-        
-        with open('config/uptime_history.json', 'w') as f:
-            json.dump(saveable_history, f, indent=2)
+        with timed_write('uptime_history'):
+            save_histories('config/uptime_history.json', get_snapshot('uptime').data)
     except Exception as e:
         logger.error(f"Error saving uptime history: {e}")
 
+# Command output is streamed: only the head and tail are kept in memory, the
+# full output is optionally spilled to a per-run log file
+output_config = config.get('output', {})
+OUTPUT_MAX_BYTES = output_config.get('max_bytes', 64 * 1024)
+OUTPUT_LOG_DIR = output_config.get('log_dir', 'logs')
+
 # SSH function
-def run_ssh_command(hostname, username, password, command):
-    """Executes an SSH command and returns the output and success status."""
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        start_time = time.time()
-        client.connect(hostname, username=username, password=password, timeout=5)
-        stdin, stdout, stderr = client.exec_command(command)
-        output = stdout.read().decode()
-        error = stderr.read().decode()
-        client.close()
-        response_time = round((time.time() - start_time) * 1000, 2)  # Convert to ms
-        return True, output + error, response_time
-    except (paramiko.AuthenticationException, paramiko.SSHException, socket.timeout, socket.error) as e:
-        return False, str(e), 0
+def run_ssh_command(hostname, username, password, command, log_path=None, port=22, timings=None):
+    """Executes an SSH command and returns the output and success status.
+
+    See probes.ssh_command; this runs it over the configured transport and
+    adds the SSH metrics and Server-Timing phase.
+    """
+    phases = {}
+    with timed_phase('ssh'):
+        success, output, response_time, error = ssh_transport.run(
+            hostname, username, password, command, port=port, log_path=log_path,
+            max_output=OUTPUT_MAX_BYTES, timings=phases
+        )
+    observe_ssh(phases, error)
+    if timings is not None:
+        timings.update(phases)
+    return success, output, response_time
+
+def observe_ssh(phases, error):
+    for name, ms in phases.items():
+        ssh_phase_seconds.labels(name).observe(ms / 1000)
+    if error:
+        ssh_failures.labels(error).inc()
+
+# Per-run log file for an update command on one server
+def update_log_path(update_id, server_name):
+    safe_name = ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in server_name)
+    return os.path.join(OUTPUT_LOG_DIR, f"update_{update_id}", f"{safe_name}.log")
 
 # Start background job to monitor device status
+sweep_lock = threading.Lock()
+# Set once the first sweep finished; /api/health reports 'warming' until then
+first_sweep_done = threading.Event()
+# Start and duration of the last finished sweep and probes left in the
+# current one, for /api/ready
+sweep_status = {'started': None, 'finished': None, 'duration': None, 'backlog': 0}
+
 def monitor_devices():
     """Background job to monitor device status and track uptime"""
-    logger.info("Running scheduled device monitoring")
-    for client in clients:
-        for server in client['servers']:
-            # Check status by running a simple command like 'hostname'
-            is_success, _, response_time = run_ssh_command(server['ip'], server['username'], server['password'], 'hostname')
-            status = 'healthy' if is_success else 'critical'
-            server['status'] = status
-            
-            # Record status with timestamp
-            uptime_history[server['name']].append({
-                'timestamp': datetime.now().isoformat(),
-                'status': status,
-                'response_time': response_time
-            })
+    with sweep_lock, sweep_seconds.time():
+        started = time.time()
+        run_sweep()
+        sweep_status.update(started=started, finished=time.time(), duration=time.time() - started)
+    first_sweep_done.set()
+
+# Startup work that used to keep the port closed until every device had been
+# probed: loading the saved state and the first sweep run on the scheduler
+def warm_up():
+    with sweep_lock, state_lock:
+        load_uptime_history()
+        load_latency_sketches()
+    monitor_devices()
+
+def run_sweep():
+    if PROBE_MODE == 'remote':
+        # Probe workers push results through the ingest API; the sweep only
+        # refreshes the derived state and persists the history
+        logger.info("Publishing device state reported by probe workers")
+    else:
+        logger.info("Running scheduled device monitoring")
+        probe_servers([server for client in clients for server in client['servers']])
+    
+    with state_lock:
+        status_counts = {}
+        for client in clients:
+            for server in client['servers']:
+                status_counts[server['status']] = status_counts.get(server['status'], 0) + 1
+        for status in ('healthy', 'critical', 'flapping', 'unknown'):
+            devices_by_status.labels(status).set(status_counts.get(status, 0))
+        
+        # Swap in the new state for request handlers
+        publish_clients()
+        publish_uptime()
     
-    # Save uptime history to file
-    save_uptime_history()
+    # Save uptime history to file, from the copies just published
+    with timed_phase('storage'):
+        save_uptime_history()
+        save_latency_sketches()
+
+def probe_servers(servers):
+    # Check status by running a simple command like 'hostname'; the
+    # transport decides how many probes run at once
+    sweep_status['backlog'] = len(servers)
+    try:
+        with timed_phase('ssh'):
+            for server, (record, error) in zip(servers, ssh_transport.probe_all(servers)):
+                observe_ssh(record['phases'], error)
+                record_probe(server, record, error)
+                sweep_status['backlog'] -= 1
+    finally:
+        sweep_status['backlog'] = 0
+
+# Probe workers look devices up by client id and name for every result
+server_index = {
+    (client['id'], server['name']): server for client in clients for server in client['servers']
+}
+
+# Devices are selected by tag expressions (see tags.py); the index only
+# changes with the config, so it's replaced as a whole on reload
+device_tags = TagIndex(clients)
+
+def select_devices(selector, client_id=None, index=None):
+    """Names of the devices matching a selector, optionally only those of one client.
+
+    Raises SelectorError for an invalid selector. Callers that look the
+    devices up afterwards pass the index they took, so a reload in between
+    can't mix two configs.
+    """
+    index = index or device_tags
+    names = index.select(selector)
+    if client_id is not None:
+        names = [name for name in names if index.clients[name] == client_id]
+    return names
+
+def selector_etag(selector):
+    return zlib.crc32(selector.encode()) if selector else 'all'
+
+# Probe worker membership: worker id -> time of its last heartbeat
+probe_workers = {}
+probe_workers_lock = threading.Lock()
+
+def probe_worker_heartbeat(worker_id):
+    with probe_workers_lock:
+        probe_workers[worker_id] = time.time()
+
+def active_probe_workers():
+    """Ids of the workers that sent a heartbeat within WORKER_TIMEOUT, sorted."""
+    cutoff = time.time() - WORKER_TIMEOUT
+    with probe_workers_lock:
+        for worker_id in [w for w, seen in probe_workers.items() if seen < cutoff]:
+            del probe_workers[worker_id]
+        return sorted(probe_workers)
+
+def observe_status(server, result):
+    """Feeds a 'healthy' or 'critical' result to the device's tracker; returns True if its status changed.
+
+    Callers hold state_lock.
+    """
+    tracker = status_trackers[server['name']]
+    changed = tracker.observe(result)
+    if changed:
+        logger.info(f"Device {server['name']} is now {tracker.status} (was {server.get('status', 'unknown')})")
+        status_transitions.labels(tracker.status).inc()
+    server['status'] = tracker.status
+    return changed
+
+# Apply one probe result, from the local sweep or a probe worker. The
+# history keeps the raw result, the device gets the debounced status.
+def record_probe(server, record, error=None):
+    """Returns True if the device's status changed."""
+    with state_lock:
+        # Connections are refused until an operator accepts the new key
+        if error == 'HostKeyMismatch':
+            server['host_key_mismatch'] = True
+        elif record['status'] == 'healthy':
+            server.pop('host_key_mismatch', None)
+        changed = observe_status(server, record['status'])
+        server['response_time'] = record['response_time']
+        if record['status'] == 'healthy' and record['response_time'] > 0:
+            detector = latency_detectors[server['name']]
+            record['anomaly'] = detector.observe(record['response_time'])
+            server['latency_anomaly'] = detector.anomalous
+            server['latency_baseline_ms'] = round(detector.mean, 2)
+            record_latency(server['name'], record['timestamp'], record['response_time'])
+        uptime_history[server['name']].append(record)
+        changed_histories.add(server['name'])
+    return changed
+
+# Schedule device monitoring to run every probe interval (5 minutes by default)
+scheduler.add_job(monitor_devices, 'interval', seconds=PROBE_INTERVAL, id='device_monitoring', jobstore='memory')
+
+# config.json is polled and re-applied while running. Devices are matched by
+# name: added devices get fresh state and are probed right away, removed ones
+# drop theirs, and changed ones keep their history but lose any pooled
+# connection made with the old settings. Users and the probe interval are
+# reloaded too; other sections still need a restart.
+reload_config_section = config.get('reload', {})
+RELOAD_INTERVAL = reload_config_section.get('interval_seconds', 10)
+RELOADABLE_SECTIONS = ('devices', 'users')
+config_watcher = ConfigWatcher(CONFIG_PATH)
+
+def reload_config():
+    """Applies config.json if it changed; returns True if a new config was applied."""
+    if not config_watcher.changed():
+        return False
+    try:
+        new_config = load_config()
+        validate_config(new_config)
+    except (OSError, ValueError) as e:
+        # A half-written or invalid file leaves the running config untouched
+        logger.error(f"Not reloading {CONFIG_PATH}: {e}")
+        return False
+    with sweep_lock:
+        with state_lock:
+            added = apply_config(new_config)
+        # New devices are probed now instead of at the next sweep
+        if added and PROBE_MODE != 'remote':
+            probe_servers(added)
+            with state_lock:
+                publish_clients()
+                publish_uptime()
+    return True
+
+def apply_config(new_config):
+    """Swaps in a validated config; returns the servers that were added."""
+    global config, clients, server_index, device_tags, users, PROBE_INTERVAL
+    added, removed, changed = diff_devices(clients, new_config['devices'])
+    old_servers = {server['name']: server for client in clients for server in client['servers']}
+    changed = set(changed)
+
+    new_clients = []
+    for client in new_config['devices']:
+        servers = []
+        for entry in client.get('servers', []):
+            old = old_servers.get(entry['name'])
+            if old is None:
+                server = entry
+                server.setdefault('status', 'unknown')
+            elif entry['name'] not in changed:
+                server = old
+            else:
+                server = dict(entry)
+                server.update({field: old[field] for field in STATE_FIELDS if field in old})
+                if connection_changed(old, server):
+                    ssh_transport.drop_connection(old['ip'], old['username'], old['password'], old.get('port', 22))
+                    if (old['ip'], old.get('port', 22)) != (server['ip'], server.get('port', 22)):
+                        server.pop('host_key_mismatch', None)
+            servers.append(server)
+        new_clients.append({**client, 'servers': servers})
+
+    for name in removed:
+        old = old_servers[name]
+        ssh_transport.drop_connection(old['ip'], old['username'], old['password'], old.get('port', 22))
+        for state in (uptime_history, frozen_histories, status_trackers, latency_detectors, device_sketches,
+                      device_clients):
+            state.pop(name, None)
+    for client in new_clients:
+        client_sketches.setdefault(client['id'], new_sketch_series())
+        for server in client['servers']:
+            name = server['name']
+            device_clients[name] = client['id']
+            if name not in uptime_history:
+                uptime_history[name] = new_uptime_history()
+                changed_histories.add(name)
+                status_trackers[name] = StatusTracker(status_policy)
+                latency_detectors[name] = LatencyDetector(latency_policy)
+                device_sketches[name] = new_sketch_series()
+    client_ids = {client['id'] for client in new_clients}
+    for client_id in [c for c in client_sketches if c not in client_ids]:
+        del client_sketches[client_id]
+
+    # Hashes are kept for users whose password didn't change
+    new_users = {
+        user: users[user] for user, password in new_config['users'].items()
+        if user in users and config['users'].get(user) == password
+    }
+
+    interval = new_config.get('probes', {}).get('interval_seconds', 300)
+    if interval != PROBE_INTERVAL:
+        PROBE_INTERVAL = interval
+        scheduler.reschedule_job('device_monitoring', jobstore='memory', trigger='interval', seconds=interval)
+
+    def startup_settings(source, name):
+        section = source.get(name)
+        if name == 'probes':
+            section = {key: value for key, value in (section or {}).items() if key != 'interval_seconds'}
+        return section
+    restart_needed = [
+        name for name in set(config) | set(new_config)
+        if name not in RELOADABLE_SECTIONS and startup_settings(config, name) != startup_settings(new_config, name)
+    ]
+    if restart_needed:
+        logger.warning(f"Changes to {', '.join(sorted(restart_needed))} in {CONFIG_PATH} apply after a restart")
+
+    clients = new_clients
+    users = new_users
+    server_index = {(client['id'], server['name']): server for client in clients for server in client['servers']}
+    device_tags = TagIndex(clients)
+    config = new_config
+    publish_clients()
+    publish_uptime()
+    logger.info(f"Reloaded {CONFIG_PATH}: {len(added)} devices added, {len(removed)} removed, "
+                f"{len(changed)} changed")
+    added = set(added)
+    return [server for client in clients for server in client['servers'] if server['name'] in added]
+
+if RELOAD_INTERVAL:
+    scheduler.add_job(reload_config, 'interval', seconds=RELOAD_INTERVAL, id='config_reload', jobstore='memory')
+
+# Updates whose run time passed while the service was down (beyond the misfire
+# grace time) are marked as missed instead of silently disappearing
+def on_job_missed(event):
+    if not event.job_id.startswith('update_'):
+        return
+    update_id = int(event.job_id[len('update_'):])
+    update = next((u for u in scheduled_updates if u['id'] == update_id), None)
+    if update and update['status'] == 'scheduled':
+        logger.warning(f"Scheduled update {update_id} missed its run time {event.scheduled_run_time}")
+        journal_update(update, status='missed', error=f"Missed scheduled run time {event.scheduled_run_time}")
 
-# Schedule device monitoring to run every 5 minutes
-scheduler.add_job(monitor_devices, 'interval', minutes=5, id='device_monitoring')
+scheduler.add_listener(on_job_missed, EVENT_JOB_MISSED)
 
 # Authentication function
 @auth.verify_password
 def verify_password(username, password):
-    if username in users and check_password_hash(users.get(username), password):
-        return username
-    return None
+    hashed = password_hash(username)
+    if hashed is None:
+        return None
+    with auth_seconds.time(), timed_phase('auth'):
+        valid = check_password_hash(hashed, password)
+    return username if valid else None
 
 def require_auth(f):
     @wraps(f)
@@ -180,9 +931,27 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated
 
+# Probe workers authenticate with the shared ingest token rather than a user
+# password, so result batches don't pay for a password hash check
+def require_ingest_token(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not INGEST_TOKEN:
+            return jsonify({"error": "Ingest API is disabled"}), 403
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode(), INGEST_TOKEN.encode()):
+            return jsonify({"error": "Invalid ingest token"}), 401
+        return f(*args, **kwargs)
+    return decorated
+
 # Email function using free SMTP service
 def send_email(to_email, subject, body):
     """Sends an email notification using free SMTP service."""
+    # Imported on first use, they only slow down startup
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
     try:
         msg = MIMEMultipart()
         msg['From'] = app.config['SMTP_USERNAME']
@@ -191,18 +960,60 @@ def send_email(to_email, subject, body):
         
         msg.attach(MIMEText(body, 'plain'))
         
-        server = smtplib.SMTP(app.config['SMTP_SERVER'], app.config['SMTP_PORT'])
-        server.starttls()
-        server.login(app.config['SMTP_USERNAME'], app.config['SMTP_PASSWORD'])
-        text = msg.as_string()
-        server.sendmail(app.config['SMTP_USERNAME'], to_email, text)
-        server.quit()
+        with smtp_seconds.time():
+            server = smtplib.SMTP(app.config['SMTP_SERVER'], app.config['SMTP_PORT'])
+            server.starttls()
+            server.login(app.config['SMTP_USERNAME'], app.config['SMTP_PASSWORD'])
+            text = msg.as_string()
+            server.sendmail(app.config['SMTP_USERNAME'], to_email, text)
+            server.quit()
+        emails_sent.labels('sent').inc()
         logger.info(f"Email sent successfully to {to_email}")
         return True
     except Exception as e:
+        emails_sent.labels('failed').inc()
         logger.error(f"Email sending failed: {e}")
         return False
 
+# Notifications are batched per recipient: events within the window go out as
+# one digest, at most max_per_hour emails per recipient, and critical events
+# skip the queue. SMTP runs on the queue's thread, never in the request path.
+notifications_config = config.get('notifications', {})
+notification_queue = NotificationQueue(
+    send_email,
+    window=notifications_config.get('window_seconds', 300),
+    max_per_hour=notifications_config.get('max_per_hour', 6),
+    max_pending=notifications_config.get('max_pending', 1000),
+    digest_prefix=notifications_config.get('digest_prefix', 'Pinewood SOC'),
+    max_retries=notifications_config.get('max_retries', 5)
+)
+
+def notify(to_email, subject, body, priority='normal'):
+    """Queues an email notification; priority='critical' sends it without waiting."""
+    notifications_queued.labels(priority).inc()
+    notification_queue.notify(to_email, subject, body, priority)
+
+# Run a single update command on one server
+def run_update_task(client, server_name, command, log_path=None):
+    server = next((s for s in client['servers'] if s['name'] == server_name), None)
+    if not server:
+        return f"Server {server_name} not found"
+        
+    # Run the update command
+    success, output, response_time = run_ssh_command(
+        server['ip'], server['username'], server['password'],
+        command, log_path=log_path, port=server.get('port', 22)
+    )
+    
+    # The result counts like a probe, so it's debounced the same way
+    with state_lock:
+        if server['name'] in status_trackers:
+            observe_status(server, 'healthy' if success else 'critical')
+    if success:
+        return f"Update successful on {server_name}: {output}"
+    else:
+        return f"Update failed on {server_name}: {output}"
+
 # Update execution function
 def execute_scheduled_update(update_id):
     """Executes a scheduled update."""
@@ -210,44 +1021,64 @@ def execute_scheduled_update(update_id):
     if not update:
         return
     
+    # A recurring definition is never executed itself, it spawns a run
+    if update.get('recurrence'):
+        run_recurring_update(update_id, group_delay=0)
+        return
+    
     # Update status to in progress
-    update['status'] = 'in_progress'
-    save_scheduled_updates()
+    with recurring_lock:
+        if open_recurring_runs.get(update['client_id']) == update_id:
+            del open_recurring_runs[update['client_id']]
+    journal_update(update, status='in_progress')
     
     # Find client
     client = next((c for c in clients if c['id'] == update['client_id']), None)
     if not client:
-        update['status'] = 'failed'
-        update['error'] = 'Client not found'
-        save_scheduled_updates()
+        journal_update(update, status='failed', error='Client not found')
         return
     
-    # Execute update on each server
-    results = []
-    for server_name in update['servers']:
-        server = next((s for s in client['servers'] if s['name'] == server_name), None)
-        if not server:
-            results.append(f"Server {server_name} not found")
-            continue
-            
-        # Run the update command
-        success, output, response_time = run_ssh_command(
-            server['ip'], server['username'], server['password'],
-            update['command']
-        )
-        
-        if success:
-            results.append(f"Update successful on {server_name}: {output}")
-            server['status'] = 'healthy'
-        else:
-            results.append(f"Update failed on {server_name}: {output}")
-            server['status'] = 'critical'
+    # Execute update on all servers in parallel. Grouped recurring runs carry
+    # their own (server, command) tasks, plain updates run one command everywhere.
+    tasks = update.get('tasks') or [
+        {'server': server_name, 'command': update['command']} for server_name in update['servers']
+    ]
+    # Full output goes to one log file per task; a grouped run can hit the same
+    # server twice, so later tasks for a server get a numbered key
+    logs = {}
+    log_paths = []
+    task_counts = {}
+    for t in tasks:
+        count = task_counts.get(t['server'], 0)
+        task_counts[t['server']] = count + 1
+        key = t['server'] if count == 0 else f"{t['server']}#{count}"
+        logs[key] = update_log_path(update_id, key)
+        log_paths.append(logs[key])
+    # Servers run in parallel, but the tasks for one server run one after
+    # another (two package upgrades would fight over the dpkg lock)
+    server_tasks = {}
+    for index, t in enumerate(tasks):
+        server_tasks.setdefault(t['server'], []).append(index)
+    results = [None] * len(tasks)
+    
+    def run_server_tasks(indexes):
+        for index in indexes:
+            results[index] = run_update_task(client, tasks[index]['server'], tasks[index]['command'],
+                                             log_paths[index])
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(len(server_tasks), UPDATE_PARALLELISM))) as pool:
+        list(pool.map(run_server_tasks, server_tasks.values()))
     
     # Update status and results
-    update['status'] = 'completed' if all('successful' in r for r in results) else 'partial'
-    update['results'] = results
-    update['completed_at'] = datetime.now().isoformat()
-    save_scheduled_updates()
+    journal_update(
+        update,
+        status='completed' if all('successful' in r for r in results) else 'partial',
+        results=results,
+        logs=logs,
+        completed_at=datetime.now().isoformat()
+    )
+    
+    publish_clients()
     
     # Create ticket
     create_ticket(update)
@@ -268,10 +1099,128 @@ def execute_scheduled_update(update_id):
         
         This is an automated message from Pinewood SOC.
         """
-        send_email(client['contact_email'], f"Update Completed - {client['name']}", email_body)
+        notify(client['contact_email'], f"Update Completed - {client['name']}", email_body,
+               priority='normal' if update['status'] == 'completed' else 'critical')
     
     # Add to history
     update_history.append(update.copy())
+    publish_update_history()
+
+# Recurring definitions that fire for the same client while a run is still
+# waiting to start join that run, so one window produces one run, one ticket
+# and one email instead of one per definition
+open_recurring_runs = {}
+recurring_lock = threading.Lock()
+
+def update_servers(update):
+    """Servers an update runs on; a selector is resolved again for every recurring run."""
+    if update.get('selector'):
+        return select_devices(update['selector'], update['client_id'])
+    return update['servers']
+
+def run_recurring_update(definition_id, group_delay=None):
+    """Fans a recurring update definition out into a (possibly shared) run."""
+    definition = next((u for u in scheduled_updates if u['id'] == definition_id), None)
+    if not definition or not definition.get('recurrence'):
+        return
+    if group_delay is None:
+        group_delay = RECURRING_GROUP_WINDOW
+    
+    servers = update_servers(definition)
+    tasks = [{'server': server_name, 'command': definition['command']} for server_name in servers]
+    with recurring_lock:
+        run = None
+        run_id = open_recurring_runs.get(definition['client_id'])
+        if run_id is not None and group_delay > 0:
+            run = next((u for u in scheduled_updates if u['id'] == run_id and u['status'] == 'scheduled'), None)
+        
+        if run is not None:
+            # Join the run that is already waiting for this client
+            update_types = run['update_type'].split(', ')
+            if definition['update_type'] not in update_types:
+                update_types.append(definition['update_type'])
+            journal_update(
+                run,
+                extend={
+                    'tasks': tasks,
+                    'servers': [s for s in servers if s not in run['servers']],
+                    'recurring_ids': [definition_id]
+                },
+                update_type=', '.join(update_types)
+            )
+            logger.info(f"Recurring update {definition_id} joined run {run['id']}")
+            return
+        
+        run_date = datetime.now() + timedelta(seconds=group_delay)
+        run = {
+            "id": max((u['id'] for u in scheduled_updates), default=0) + 1,
+            "client_id": definition['client_id'],
+            "servers": list(servers),
+            "scheduled_time": run_date.isoformat(),
+            "update_type": definition['update_type'],
+            "command": definition['command'],
+            "tasks": tasks,
+            "recurring_ids": [definition_id],
+            "status": "scheduled",
+            "created_at": datetime.now().isoformat()
+        }
+        scheduled_updates.append(run)
+        publish_scheduled_updates()
+        try:
+            update_journal.put(run)
+        except Exception as e:
+            logger.error(f"Error journaling update {run['id']}: {e}")
+        if group_delay > 0:
+            open_recurring_runs[definition['client_id']] = run['id']
+    
+    if group_delay > 0:
+        scheduler.add_job(
+            execute_scheduled_update,
+            'date',
+            run_date=run_date,
+            args=[run['id']],
+            id=f"update_{run['id']}",
+            replace_existing=True
+        )
+    else:
+        execute_scheduled_update(run['id'])
+
+# Crontab numbers weekdays 0-7 from Sunday, APScheduler 0-6 from Monday
+def crontab_day_of_week(field):
+    if field == '*' or any(ch.isalpha() for ch in field):
+        return field
+    days = set()
+    for part in field.split(','):
+        part, _, step = part.partition('/')
+        if part == '*':
+            start, end = 0, 6
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = end = int(part)
+        if not 0 <= start <= 7 or not 0 <= end <= 7:
+            raise ValueError(f"Invalid day of week: {field}")
+        days.update((day + 6) % 7 for day in range(start, end + 1, int(step) if step else 1))
+    return ','.join(str(day) for day in sorted(days))
+
+# Build the trigger for an update: a cron schedule for recurring definitions,
+# a one-shot date otherwise. Raises ValueError for invalid input.
+def update_trigger(update):
+    recurrence = update.get('recurrence')
+    if recurrence:
+        fields = recurrence['cron'].split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 cron fields, got {len(fields)}")
+        minute, hour, day, month, day_of_week = fields
+        try:
+            return CronTrigger(
+                minute=minute, hour=hour, day=day, month=month,
+                day_of_week=crontab_day_of_week(day_of_week),
+                timezone=recurrence.get('timezone') or 'UTC'
+            )
+        except UnknownTimeZoneError:
+            raise ValueError(f"Unknown timezone: {recurrence.get('timezone')}")
+    return DateTrigger(run_date=datetime.fromisoformat(update['scheduled_time'].replace('Z', '+00:00')))
 
 # Ticket creation function
 def create_ticket(update):
@@ -292,8 +1241,55 @@ def create_ticket(update):
     }
     
     tickets.append(ticket)
+    publish_tickets()
     return True
 
+# Per-route request latency, Server-Timing breakdown and slow request profiling
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    slow_request_profiler.start_request()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.get('request_start')
+    if start is not None:
+        duration = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_seconds.labels(route, request.method, str(response.status_code)).observe(duration)
+        phases = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in g.get('phase_timings', {}).items()]
+        phases.append(f"total;dur={duration * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(phases)
+    return response
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.direct_passthrough or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    if not response.is_streamed and response.content_length is not None \
+            and response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+    
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress_body(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.headers.add('Vary', 'Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    slow_request_profiler.finish_request(f"{request.method} {request.path}")
+
 # Routes
 @app.route('/')
 def index():
@@ -303,15 +1299,143 @@ def index():
 @app.route('/api/devices', methods=['GET'])
 @require_auth
 def get_devices():
-    """API endpoint to get the current status of all devices."""
-    for client in clients:
-        for server in client['servers']:
-            # Check status by running a simple command like 'hostname'
-            is_success, _, response_time = run_ssh_command(server['ip'], server['username'], server['password'], 'hostname')
-            server['status'] = 'healthy' if is_success else 'critical'
-            server['response_time'] = response_time
+    """API endpoint to get the current status of all devices.
+
+    Serves the result of the last monitoring sweep; ?refresh=true runs a sweep first.
+    ?selector=<tag expression> only returns the matching devices.
+    """
+    if request.args.get('refresh', '').lower() in ('1', 'true'):
+        monitor_devices()
+    
+    selector = request.args.get('selector')
+    if not selector:
+        return snapshot_response('clients')
+    index = device_tags
+    try:
+        names = select_devices(selector, index=index)
+    except SelectorError as e:
+        return jsonify({"error": f"Invalid selector: {e}"}), 400
+    etag = snapshot_etag('clients', selector_etag(selector))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Only the clients owning a match are scanned
+    by_client = {}
+    for name in names:
+        by_client.setdefault(index.clients[name], set()).add(name)
+    response = jsonify([
+        {**client, 'servers': [server for server in client['servers'] if server['name'] in by_client[client['id']]]}
+        for client in get_snapshot('clients').data if client['id'] in by_client
+    ])
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/tags', methods=['GET'])
+@require_auth
+def get_tags():
+    """API endpoint listing device tags with the number of devices carrying each."""
+    return jsonify(device_tags.tags())
+
+# Device actions, used by the per-device endpoints and by bulk actions.
+# Each returns (success, output) and notifies the client on success.
+def run_with_fallback(device, commands):
+    """Runs commands in turn until one succeeds or fails for another reason than missing sudo."""
+    last_error = ""
+    for cmd in commands:
+        is_success, output, response_time = run_ssh_command(
+            device['ip'], device['username'], device['password'],
+            cmd, port=device.get('port', 22)
+        )
+        if is_success:
+            return True, output
+        last_error = output
+        # If the error is about sudo not found, try the next command
+        if "sudo: not found" not in output:
+            break
+    return False, last_error
+
+def restart_device(client, device):
+    # Try with sudo first, then without if sudo is not found
+    is_success, output = run_with_fallback(
+        device, ['sudo systemctl reboot', 'systemctl reboot', 'sudo reboot', 'reboot'])
+    if is_success:
+        email_body = f"Service restarted successfully on {device['name']} at {datetime.now()}"
+        notify(client['contact_email'], f"Service Restart - {device['name']}", email_body)
+    return is_success, output
+
+def shutdown_device_now(client, device):
+    is_success, output = run_with_fallback(
+        device, ['sudo shutdown -h now', 'shutdown -h now', 'sudo poweroff', 'poweroff'])
+    if is_success:
+        email_body = f"Device shutdown initiated on {device['name']} at {datetime.now()}"
+        notify(client['contact_email'], f"Device Shutdown - {device['name']}", email_body, priority='critical')
+    return is_success, output
+
+def apply_common_fix(client, device):
+    # Get current time for filename
+    timestamp = datetime.now().strftime("%M_%S::%d_%m")  # Minutes_Seconds::Day_Month
+    
+    # Create a fix file on the device
+    is_success, output, response_time = run_ssh_command(
+        device['ip'], device['username'], device['password'],
+        f'echo "Fixed at $(date)" > /tmp/fixed_{timestamp}.txt && echo "Fix file created: /tmp/fixed_{timestamp}.txt"',
+        port=device.get('port', 22)
+    )
+    if is_success:
+        email_body = f"Common fix applied to {device['name']} at {datetime.now()}. Fix file created: /tmp/fixed_{timestamp}.txt"
+        notify(client['contact_email'], f"Common Fix Applied - {device['name']}", email_body)
+    return is_success, output
+
+def create_device_alert(client, device):
+    # For now, just create a simple alert file
+    is_success, output, response_time = run_ssh_command(
+        device['ip'], device['username'], device['password'],
+        f'echo "Alert created at $(date)" > /tmp/alert_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt',
+        port=device.get('port', 22)
+    )
+    return is_success, output
+
+DEVICE_ACTIONS = {
+    'restart': restart_device,
+    'shutdown': shutdown_device_now,
+    'fix': apply_common_fix,
+    'alert': create_device_alert,
+}
+
+@app.route('/api/devices/actions', methods=['POST'])
+@require_auth
+def bulk_device_action():
+    """API endpoint to run a device action on every device matching a tag selector."""
+    data = request.json or {}
+    action = DEVICE_ACTIONS.get(data.get('action'))
+    if action is None:
+        return jsonify({"error": f"Unknown action, expected one of: {', '.join(DEVICE_ACTIONS)}"}), 400
+    if not data.get('selector'):
+        return jsonify({"error": "Missing required field: selector"}), 400
+    # Devices are resolved from one index, which a reload replaces as a whole
+    index = device_tags
+    try:
+        names = select_devices(data['selector'], index=index)
+    except SelectorError as e:
+        return jsonify({"error": f"Invalid selector: {e}"}), 400
+    if not names:
+        return jsonify({"error": "No devices match the selector"}), 404
+    
+    targets = [index.devices[name] for name in names]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(targets), UPDATE_PARALLELISM))) as pool:
+        results = list(pool.map(lambda target: action(*target), targets))
     
-    return jsonify(clients)
+    succeeded = sum(1 for is_success, _ in results if is_success)
+    logger.info(f"Bulk {data['action']} on {len(names)} devices ({data['selector']}): {succeeded} succeeded")
+    return jsonify({
+        "action": data['action'],
+        "selector": data['selector'],
+        "status": 'completed' if succeeded == len(results) else 'partial' if succeeded else 'failed',
+        "results": {
+            name: {"success": is_success, "output": output} for name, (is_success, output) in zip(names, results)
+        }
+    })
 
 @app.route('/api/device/<client_id>/<device_name>/restart', methods=['POST'])
 @require_auth
@@ -325,34 +1449,10 @@ def restart_service(client_id, device_name):
     if not target_device:
         return jsonify({"error": "Device not found"}), 404
 
-    # Try with sudo first, then without if sudo is not found
-    commands_to_try = [
-        'sudo systemctl reboot',
-        'systemctl reboot',
-        'sudo reboot',
-        'reboot'
-    ]
-    
-    last_error = ""
-    for cmd in commands_to_try:
-        is_success, output, response_time = run_ssh_command(
-            target_device['ip'], target_device['username'], target_device['password'],
-            cmd
-        )
-        
-        if is_success:
-            # Send notification email
-            email_body = f"Service restarted successfully on {device_name} at {datetime.now()}"
-            send_email(client['contact_email'], f"Service Restart - {device_name}", email_body)
-            
-            return jsonify({"message": f"Restart command sent to {device_name}", "output": output})
-        else:
-            last_error = output
-            # If the error is about sudo not found, try the next command
-            if "sudo: not found" not in output:
-                break
-    
-    return jsonify({"error": f"Failed to restart {device_name}", "details": last_error}), 500
+    is_success, output = restart_device(client, target_device)
+    if is_success:
+        return jsonify({"message": f"Restart command sent to {device_name}", "output": output})
+    return jsonify({"error": f"Failed to restart {device_name}", "details": output}), 500
 
 @app.route('/api/device/<client_id>/<device_name>/shutdown', methods=['POST'])
 @require_auth
@@ -366,34 +1466,10 @@ def shutdown_device(client_id, device_name):
     if not target_device:
         return jsonify({"error": "Device not found"}), 404
 
-    # Try with sudo first, then without if sudo is not found
-    commands_to_try = [
-        'sudo shutdown -h now',
-        'shutdown -h now',
-        'sudo poweroff',
-        'poweroff'
-    ]
-    
-    last_error = ""
-    for cmd in commands_to_try:
-        is_success, output, response_time = run_ssh_command(
-            target_device['ip'], target_device['username'], target_device['password'],
-            cmd
-        )
-        
-        if is_success:
-            # Send notification email
-            email_body = f"Device shutdown initiated on {device_name} at {datetime.now()}"
-            send_email(client['contact_email'], f"Device Shutdown - {device_name}", email_body)
-            
-            return jsonify({"message": f"Shutdown command sent to {device_name}", "output": output})
-        else:
-            last_error = output
-            # If the error is about sudo not found, try the next command
-            if "sudo: not found" not in output:
-                break
-    
-    return jsonify({"error": f"Failed to shutdown {device_name}", "details": last_error}), 500
+    is_success, output = shutdown_device_now(client, target_device)
+    if is_success:
+        return jsonify({"message": f"Shutdown command sent to {device_name}", "output": output})
+    return jsonify({"error": f"Failed to shutdown {device_name}", "details": output}), 500
 
 @app.route('/api/device/<client_id>/<device_name>/fix', methods=['POST'])
 @require_auth
@@ -407,21 +1483,8 @@ def common_fix(client_id, device_name):
     if not target_device:
         return jsonify({"error": "Device not found"}), 404
 
-    # Get current time for filename
-    now = datetime.now()
-    timestamp = now.strftime("%M_%S::%d_%m")  # Minutes_Seconds::Day_Month
-    
-    # Create a fix file on the device
-    is_success, output, response_time = run_ssh_command(
-        target_device['ip'], target_device['username'], target_device['password'],
-        f'echo "Fixed at $(date)" > /tmp/fixed_{timestamp}.txt && echo "Fix file created: /tmp/fixed_{timestamp}.txt"'
-    )
-
+    is_success, output = apply_common_fix(client, target_device)
     if is_success:
-        # Send notification email
-        email_body = f"Common fix applied to {device_name} at {datetime.now()}. Fix file created: /tmp/fixed_{timestamp}.txt"
-        send_email(client['contact_email'], f"Common Fix Applied - {device_name}", email_body)
-        
         return jsonify({"message": f"Common fix applied to {device_name}", "output": output})
     else:
         return jsonify({"error": f"Failed to apply fix to {device_name}", "details": output}), 500
@@ -438,104 +1501,173 @@ def create_alert(client_id, device_name):
     if not target_device:
         return jsonify({"error": "Device not found"}), 404
 
-    # For now, just create a simple alert file
-    is_success, output, response_time = run_ssh_command(
-        target_device['ip'], target_device['username'], target_device['password'],
-        f'echo "Alert created at $(date)" > /tmp/alert_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-    )
-
+    is_success, output = create_device_alert(client, target_device)
     if is_success:
         return jsonify({"message": f"Alert created for {device_name}", "output": output})
     else:
         return jsonify({"error": f"Failed to create alert for {device_name}", "details": output}), 500
 
+# Uptime endpoints return JSON by default; clients that ask for it get the
+# compact columnar binary layout (or MessagePack, if installed) instead
+UPTIME_FORMATS = {'application/json': 'json', COLUMNAR_MIMETYPE: 'columnar', 'application/msgpack': 'msgpack'}
+
+def uptime_format():
+    offered = ['application/json', COLUMNAR_MIMETYPE] + (['application/msgpack'] if msgpack else [])
+    return request.accept_mimetypes.best_match(offered, default='application/json')
+
+def vary_accept(response):
+    # Every format of an uptime endpoint shares its URL, so caches key on Accept
+    response.headers.add('Vary', 'Accept')
+    return response
+
+def binary_uptime_response(devices, mimetype, etag):
+    with timed_phase('serialize'):
+        if mimetype == COLUMNAR_MIMETYPE:
+            body = encode_uptime(devices)
+        else:
+            body = encode_uptime_msgpack(devices, msgpack)
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    return vary_accept(response)
+
+@app.route('/api/device/<client_id>/<device_name>/host-key', methods=['DELETE'])
+@require_auth
+def accept_host_key(client_id, device_name):
+    """API endpoint to forget a device's recorded host key after it legitimately changed.
+
+    The key the device presents on the next connection is recorded instead.
+    """
+    if PROBE_MODE == 'remote':
+        return jsonify({"error": "Host keys are kept by the probe workers"}), 409
+    server = server_index.get((int(client_id), device_name))
+    if server is None:
+        return jsonify({"error": "Device not found"}), 404
+    ssh_transport.forget_host_key(server['ip'], server.get('port', 22))
+    server.pop('host_key_mismatch', None)
+    publish_clients()
+    logger.warning(f"Host key for {device_name} ({server['ip']}) was reset")
+    return jsonify({"message": f"Host key for {device_name} will be recorded on the next connection"})
+
 @app.route('/api/uptime/<device_name>', methods=['GET'])
 @require_auth
 def get_uptime_data(device_name):
     """API endpoint to get uptime history for a device."""
-    if device_name not in uptime_history:
+    uptime = get_snapshot('uptime').data
+    if device_name not in uptime:
         return jsonify({"error": "Device not found"}), 404
     
     # Get time range from query parameters (default: 24 hours)
     hours = int(request.args.get('hours', 24))
+    mimetype = uptime_format()
+    etag = snapshot_etag('uptime', device_name, hours, UPTIME_FORMATS[mimetype])
+    cached = not_modified(etag)
+    if cached:
+        return vary_accept(cached)
     since_time = datetime.now() - timedelta(hours=hours)
     
-    # Filter data by time range
-    filtered_data = []
-    for record in uptime_history[device_name]:
-        record_time = datetime.fromisoformat(record['timestamp'])
-        if record_time >= since_time:
-            filtered_data.append(record)
-    
-    # Calculate uptime statistics
-    total_checks = len(filtered_data)
-    if total_checks == 0:
-        return jsonify({
-            "device": device_name,
-            "data": [],
-            "stats": {
-                "uptime_percentage": 0,
-                "downtime_percentage": 0,
-                "total_checks": 0,
-                "healthy_checks": 0,
-                "critical_checks": 0
-            }
-        })
+    history = uptime[device_name]
+    # Uptime statistics come from the status intervals, not the samples
+    stats = {
+        **history.stats(since_time),
+        "latency": get_snapshot('latency').data.get(device_name),
+        "response_time_percentiles": response_time_percentiles(
+            get_snapshot('sketches').data['devices'].get(device_name), since_time)
+    }
     
-    healthy_checks = sum(1 for record in filtered_data if record['status'] == 'healthy')
-    uptime_percentage = (healthy_checks / total_checks) * 100
+    # Binary formats are built straight from the sample tuples
+    if mimetype != 'application/json':
+        return binary_uptime_response([(device_name, history.samples_since(since_time), stats)], mimetype, etag)
     
-    return jsonify({
-        "device": device_name,
-        "data": filtered_data,
-        "stats": {
-            "uptime_percentage": round(uptime_percentage, 2),
-            "downtime_percentage": round(100 - uptime_percentage, 2),
-            "total_checks": total_checks,
-            "healthy_checks": healthy_checks,
-            "critical_checks": total_checks - healthy_checks
-        }
-    })
+    with timed_phase('serialize'):
+        response = jsonify({
+            "device": device_name,
+            "data": history.records_since(since_time),
+            "intervals": history.intervals_since(since_time),
+            "stats": stats
+        })
+    response.set_etag(etag)
+    return vary_accept(response)
 
 @app.route('/api/uptime', methods=['GET'])
 @require_auth
 def get_all_uptime_data():
-    """API endpoint to get uptime history for all devices."""
+    """API endpoint to get uptime history for all devices, or those matching ?selector=."""
     hours = int(request.args.get('hours', 24))
+    selector = request.args.get('selector')
+    mimetype = uptime_format()
+    # The time window is evaluated once per snapshot version (i.e. per sweep)
+    etag = snapshot_etag('uptime', hours, UPTIME_FORMATS[mimetype], selector_etag(selector))
+    cached = not_modified(etag)
+    if cached:
+        return vary_accept(cached)
     since_time = datetime.now() - timedelta(hours=hours)
+    uptime = get_snapshot('uptime').data
+    latency = get_snapshot('latency').data
+    sketches = get_snapshot('sketches').data['devices']
+    if selector:
+        try:
+            uptime = {name: uptime[name] for name in select_devices(selector) if name in uptime}
+        except SelectorError as e:
+            return jsonify({"error": f"Invalid selector: {e}"}), 400
     
-    result = {}
-    for device_name in uptime_history:
-        # Filter data by time range
-        filtered_data = []
-        for record in uptime_history[device_name]:
-            record_time = datetime.fromisoformat(record['timestamp'])
-            if record_time >= since_time:
-                filtered_data.append(record)
-        
-        # Calculate uptime statistics
-        total_checks = len(filtered_data)
-        healthy_checks = sum(1 for record in filtered_data if record['status'] == 'healthy')
-        uptime_percentage = (healthy_checks / total_checks) * 100 if total_checks > 0 else 0
-        
-        result[device_name] = {
-            "data": filtered_data,
-            "stats": {
-                "uptime_percentage": round(uptime_percentage, 2),
-                "downtime_percentage": round(100 - uptime_percentage, 2),
-                "total_checks": total_checks,
-                "healthy_checks": healthy_checks,
-                "critical_checks": total_checks - healthy_checks
-            }
+    def device_stats(device_name, history):
+        return {
+            **history.stats(since_time),
+            "latency": latency.get(device_name),
+            "response_time_percentiles": response_time_percentiles(sketches.get(device_name), since_time)
         }
     
-    return jsonify(result)
+    if mimetype != 'application/json':
+        devices = []
+        for device_name, history in uptime.items():
+            devices.append((device_name, history.samples_since(since_time), device_stats(device_name, history)))
+        return binary_uptime_response(devices, mimetype, etag)
+    
+    # Streamed one device at a time instead of building the whole result
+    def device_results():
+        for device_name, history in uptime.items():
+            yield device_name, {
+                "data": history.records_since(since_time),
+                "stats": device_stats(device_name, history)
+            }
+    
+    return vary_accept(streaming_json_response(stream_json_object(device_results()), etag))
+
+@app.route('/api/latency', methods=['GET'])
+@require_auth
+def get_latency_percentiles():
+    """API endpoint for response time percentiles per device, per client and fleet-wide."""
+    hours = int(request.args.get('hours', 24))
+    etag = snapshot_etag('uptime', 'latency', hours)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    since_time = datetime.now() - timedelta(hours=hours)
+    sketches = get_snapshot('sketches').data
+    
+    # Windows are rounded out to whole sketch buckets
+    with timed_phase('sketch'):
+        response = jsonify({
+            "hours": hours,
+            "bucket_minutes": SKETCH_BUCKET_SECONDS // 60,
+            "fleet": response_time_percentiles(sketches['fleet'], since_time),
+            "clients": {
+                str(client_id): response_time_percentiles(series, since_time)
+                for client_id, series in sketches['clients'].items()
+            },
+            "devices": {
+                device: response_time_percentiles(series, since_time)
+                for device, series in sketches['devices'].items()
+            }
+        })
+    response.set_etag(etag)
+    return response
 
 @app.route('/api/clients', methods=['GET'])
 @require_auth
 def get_clients():
     """API endpoint to get all clients."""
-    return jsonify(clients)
+    return snapshot_response('clients')
 
 @app.route('/api/schedule-update', methods=['POST'])
 @require_auth
@@ -543,42 +1675,71 @@ def schedule_update():
     """API endpoint to schedule an update."""
     data = request.json
     
-    # Validate required fields
-    required_fields = ['client_id', 'servers', 'scheduled_time', 'update_type', 'command']
+    # Validate required fields. An update runs once at 'scheduled_time' or
+    # repeatedly on a 'cron' schedule (crontab syntax, optional 'timezone').
+    # Servers are listed by name or chosen with a tag 'selector'; the client
+    # may then be left out if all matches belong to one.
+    required_fields = ['update_type', 'command'] + ([] if 'selector' in data else ['client_id', 'servers'])
     for field in required_fields:
         if field not in data:
             return jsonify({"error": f"Missing required field: {field}"}), 400
+    if 'scheduled_time' not in data and 'cron' not in data:
+        return jsonify({"error": "Missing required field: scheduled_time or cron"}), 400
+    if 'selector' in data:
+        index = device_tags
+        try:
+            servers = select_devices(data['selector'], data.get('client_id'), index=index)
+        except SelectorError as e:
+            return jsonify({"error": f"Invalid selector: {e}"}), 400
+        client_ids = {index.clients[name] for name in servers}
+        if not servers:
+            return jsonify({"error": "No devices match the selector"}), 400
+        if len(client_ids) > 1:
+            return jsonify({"error": "Selector matches devices of several clients, add client:<id> or client_id"}), 400
+        data = {**data, 'client_id': client_ids.pop(), 'servers': servers}
     
-    # Create update ID
-    update_id = len(scheduled_updates) + 1
+    # Create update ID (ids must stay unique after deletes, the journal is keyed by id)
+    update_id = max((u['id'] for u in scheduled_updates), default=0) + 1
     
     # Create scheduled update
     scheduled_update = {
         "id": update_id,
         "client_id": data['client_id'],
         "servers": data['servers'],
-        "scheduled_time": data['scheduled_time'],
+        "scheduled_time": data.get('scheduled_time'),
         "update_type": data['update_type'],
         "command": data['command'],
         "status": "scheduled",
         "created_at": datetime.now().isoformat()
     }
+    if 'selector' in data:
+        scheduled_update['selector'] = data['selector']
+    if 'cron' in data:
+        scheduled_update['recurrence'] = {"cron": data['cron'], "timezone": data.get('timezone', 'UTC')}
+        scheduled_update['status'] = 'recurring'
+    
+    # Validate the schedule before anything is stored
+    try:
+        trigger = update_trigger(scheduled_update)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid schedule: {e}"}), 400
     
     scheduled_updates.append(scheduled_update)
-    save_scheduled_updates()
+    publish_scheduled_updates()
+    try:
+        with timed_phase('storage'):
+            update_journal.put(scheduled_update)
+    except Exception as e:
+        logger.error(f"Error journaling update {update_id}: {e}")
     
     # Schedule the job
-    try:
-        run_date = datetime.fromisoformat(data['scheduled_time'].replace('Z', '+00:00'))
-        scheduler.add_job(
-            execute_scheduled_update,
-            'date',
-            run_date=run_date,
-            args=[update_id],
-            id=f"update_{update_id}"
-        )
-    except ValueError as e:
-        return jsonify({"error": f"Invalid date format: {e}"}), 400
+    scheduler.add_job(
+        execute_scheduled_update if 'recurrence' not in scheduled_update else run_recurring_update,
+        trigger,
+        args=[update_id],
+        id=f"update_{update_id}",
+        replace_existing=True
+    )
     
     # Find client for notification
     client = next((c for c in clients if c['id'] == data['client_id']), None)
@@ -588,13 +1749,14 @@ def schedule_update():
         A system update has been scheduled for your servers.
         
         Update Details:
-        - Scheduled Time: {data['scheduled_time']}
+        - Scheduled Time: {data.get('scheduled_time') or f"{data['cron']} ({data.get('timezone', 'UTC')}), recurring"}
         - Servers: {', '.join(data['servers'])}
         - Update Type: {data['update_type']}
         
         This is an automated message from Pinewood SOC.
         """
-        send_email(client['contact_email'], f"Scheduled Update Notification - {client['name']}", email_body)
+        notify(client['contact_email'], f"Scheduled Update Notification - {client['name']}", email_body,
+               priority='critical' if data['update_type'] == 'critical' else 'normal')
     
     return jsonify({"message": "Update scheduled successfully", "update_id": update_id})
 
@@ -613,6 +1775,7 @@ def delete_scheduled_update(update_id):
     update_id = int(update_id)
     global scheduled_updates
     scheduled_updates = [u for u in scheduled_updates if u['id'] != update_id]
+    publish_scheduled_updates()
     
     # Also remove the job from the scheduler if it exists
     try:
@@ -620,26 +1783,53 @@ def delete_scheduled_update(update_id):
     except:
         pass
     
-    save_scheduled_updates()
+    try:
+        with timed_phase('storage'):
+            update_journal.delete(update_id)
+    except Exception as e:
+        logger.error(f"Error journaling delete of update {update_id}: {e}")
     return jsonify({"message": f"Update {update_id} deleted"})
 
 @app.route('/api/scheduled-updates', methods=['GET'])
 @require_auth
 def get_scheduled_updates():
     """API endpoint to get all scheduled updates."""
-    return jsonify(scheduled_updates)
+    return snapshot_response('scheduled_updates')
 
 @app.route('/api/update-history', methods=['GET'])
 @require_auth
 def get_update_history():
     """API endpoint to get update history."""
-    return jsonify(update_history)
+    # History only grows, so it is streamed page by page rather than cached whole
+    etag = snapshot_etag('update_history')
+    return not_modified(etag) or streaming_json_response(
+        stream_json_array(get_snapshot('update_history').data), etag)
+
+@app.route('/api/update-log/<update_id>/<server_name>', methods=['GET'])
+@require_auth
+def get_update_log(update_id, server_name):
+    """API endpoint to stream the full command output of an update run."""
+    update = next((u for u in scheduled_updates if u['id'] == int(update_id)), None)
+    log_path = (update or {}).get('logs', {}).get(server_name)
+    if not log_path or not os.path.exists(log_path):
+        return jsonify({"error": "Log not found"}), 404
+    
+    def generate():
+        with open(log_path, 'rb') as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+    
+    return Response(generate(), mimetype='text/plain')
 
 @app.route('/api/tickets', methods=['GET'])
 @require_auth
 def get_tickets():
     """API endpoint to get all tickets."""
-    return jsonify(tickets)
+    etag = snapshot_etag('tickets')
+    return not_modified(etag) or streaming_json_response(stream_json_array(get_snapshot('tickets').data), etag)
 
 @app.route('/api/reports/updates', methods=['GET'])
 @require_auth
@@ -655,7 +1845,7 @@ def get_update_reports():
         start_date = datetime.now() - timedelta(days=7)
     
     # Filter updates by date
-    recent_updates = [u for u in update_history if datetime.fromisoformat(u.get('completed_at', '2000-01-01')) >= start_date]
+    recent_updates = [u for u in get_snapshot('update_history').data if datetime.fromisoformat(u.get('completed_at', '2000-01-01')) >= start_date]
     
     # Generate report data
     report_data = {
@@ -674,23 +1864,188 @@ def get_update_reports():
     
     return jsonify(report_data)
 
+@app.route('/api/probes/heartbeat', methods=['POST'])
+@require_ingest_token
+def probe_heartbeat():
+    """API endpoint for probe workers to join and get the current membership."""
+    worker_id = (request.json or {}).get('worker_id')
+    if not worker_id or not isinstance(worker_id, str):
+        return jsonify({"error": "Missing worker_id"}), 400
+    probe_worker_heartbeat(worker_id)
+    return jsonify({"workers": active_probe_workers(), "interval": PROBE_INTERVAL})
+
+@app.route('/api/probes/results', methods=['POST'])
+@require_ingest_token
+def ingest_probe_results():
+    """API endpoint for probe workers to push a batch of probe results."""
+    data = request.json or {}
+    worker_id = data.get('worker_id')
+    results = data.get('results')
+    if not worker_id or not isinstance(results, list):
+        return jsonify({"error": "Missing worker_id or results"}), 400
+    probe_worker_heartbeat(worker_id)
+    
+    accepted = 0
+    rejected = []
+    status_changed = False
+    # Held for the whole batch, so the sweep publishes and saves either none
+    # or all of it
+    with timed_phase('ingest'), state_lock:
+        for result in results:
+            try:
+                server = server_index.get((result['client_id'], result['device']))
+                record = result['record']
+                error = result.get('error')
+                if server is None or record['status'] not in ('healthy', 'critical') or \
+                        not isinstance(error, (str, type(None))):
+                    rejected.append(result.get('device'))
+                    continue
+                datetime.fromisoformat(record['timestamp'])
+                status_changed |= record_probe(server, {
+                    'timestamp': record['timestamp'],
+                    'status': record['status'],
+                    'response_time': float(record.get('response_time') or 0),
+                    'phases': {k: float(v) for k, v in (record.get('phases') or {}).items()}
+                }, error)
+                accepted += 1
+            except (KeyError, TypeError, ValueError, AttributeError):
+                rejected.append(result.get('device') if isinstance(result, dict) else None)
+        # Status changes go out right away; response times and history are
+        # published with the periodic sweep
+        if status_changed:
+            publish_clients()
+            publish_uptime()
+    
+    return jsonify({"accepted": accepted, "rejected": rejected})
+
+@app.route('/api/probes/workers', methods=['GET'])
+@require_auth
+def get_probe_workers():
+    """API endpoint to list probe workers and the size of their shards."""
+    workers = active_probe_workers()
+    ring = probes.HashRing(workers)
+    shard_sizes = dict.fromkeys(workers, 0)
+    if workers:
+        for client_id, server_name in server_index:
+            shard_sizes[ring.node_for(probes.device_key(client_id, server_name))] += 1
+    with probe_workers_lock:
+        last_seen = dict(probe_workers)
+    return jsonify({
+        "mode": PROBE_MODE,
+        "workers": [
+            {
+                "id": worker_id,
+                "last_seen": datetime.fromtimestamp(last_seen[worker_id]).isoformat() if worker_id in last_seen else None,
+                "devices": shard_sizes[worker_id]
+            }
+            for worker_id in workers
+        ]
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metrics endpoint in the Prometheus text format."""
+    return Response(registry.render(), content_type=registry.content_type)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """API endpoint for health check."""
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    """API endpoint for health check; 'warming' until the first sweep finished."""
+    return jsonify({
+        "status": "healthy" if first_sweep_done.is_set() else "warming",
+        "timestamp": datetime.now().isoformat()
+    })
+
+# Thresholds past which /api/ready reports the instance as not ready
+readiness_config = config.get('readiness', {})
+MAX_SWEEP_AGE = readiness_config.get('max_sweep_age_seconds')
+MAX_QUEUE_DEPTH = readiness_config.get('max_queue_depth', 1000)
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness for load balancers: 503 with the problems found if saturated or stale.
+
+    Only reads counters the app already keeps, so it's cheap to poll.
+    """
+    now = time.time()
+    problems = []
+    if not first_sweep_done.is_set():
+        problems.append("warming up")
+
+    finished = sweep_status['finished']
+    sweep_age = now - finished if finished else None
+    max_sweep_age = MAX_SWEEP_AGE or 3 * PROBE_INTERVAL
+    if PROBE_MODE != 'remote' and sweep_age is not None and sweep_age > max_sweep_age:
+        problems.append(f"last sweep finished {sweep_age:.0f}s ago")
+
+    transport = {} if PROBE_MODE == 'remote' else ssh_transport.stats()
+    if transport.get('alive', 0) < transport.get('processes', 0):
+        problems.append(f"{transport['processes'] - transport['alive']} probe processes died")
+    workers = active_probe_workers() if PROBE_MODE == 'remote' else None
+    if workers == []:
+        problems.append("no probe workers reporting")
+
+    memory_jobs = scheduler.get_jobs(jobstore='memory')
+    # Jobs added before the scheduler started have no next run time yet
+    next_runs = {job.id: getattr(job, 'next_run_time', None) for job in memory_jobs}
+    next_update = job_store.get_next_run_time()
+    if not scheduler.running:
+        problems.append("scheduler not running")
+    monitoring = next_runs.get('device_monitoring')
+    if monitoring and now - monitoring.timestamp() > 60:
+        problems.append(f"device monitoring is {now - monitoring.timestamp():.0f}s overdue")
+
+    queued = notification_queue.pending()
+    if queued > MAX_QUEUE_DEPTH:
+        problems.append(f"{queued} notifications queued")
+
+    body = {
+        "status": "not_ready" if problems else "ready",
+        "problems": problems,
+        "timestamp": datetime.now().isoformat(),
+        "sweep": {
+            "mode": PROBE_MODE,
+            "last_finished": iso(finished),
+            "age_seconds": round(sweep_age, 1) if sweep_age is not None else None,
+            "duration_seconds": round(sweep_status['duration'], 3) if sweep_status['duration'] is not None else None,
+            "running": sweep_lock.locked(),
+            "backlog": sweep_status['backlog'],
+        },
+        "probes": {"transport": transport, "workers": workers},
+        "scheduler": {
+            "running": scheduler.running,
+            "jobs": job_store.count_jobs() + len(memory_jobs),
+            "next_runs": {job_id: run.isoformat() if run else None for job_id, run in next_runs.items()},
+            "next_update": next_update.isoformat() if next_update else None,
+        },
+        "queues": {"notifications": queued},
+        "storage": {
+            store: {"last_write_ms": ms, "written": iso(at)}
+            for store, (ms, at) in last_storage_writes.items()
+        },
+    }
+    return jsonify(body), 503 if problems else 200
 
 if __name__ == '__main__':
+    # Start the scheduler paused so restored jobs don't fire while we reconcile
+    if not scheduler.running:
+        scheduler.start(paused=True)
+
     # Load saved data
     load_scheduled_updates()
-    load_uptime_history()
+
+    # Digests still waiting in the queue go out on shutdown
+    atexit.register(notification_queue.flush)
     
-    # Run initial device monitoring
-    monitor_devices()
+    # Uptime history, sketches and the initial device monitoring load in the
+    # background while the server already accepts requests
+    scheduler.add_job(warm_up, id='warm_up', jobstore='memory')
     
-    # Start the scheduler only if it's not already running
-    if not scheduler.running:
-        scheduler.start()
-        logger.info("Scheduler started successfully")
+    scheduler.resume()
+    logger.info("Scheduler started successfully")
     
-    # Run the Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Run the Flask app. The reloader would start the whole service a second
+    # time in a child process, so it is off.
+    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
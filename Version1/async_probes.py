@@ -0,0 +1,128 @@
+"""asyncio SSH transport built on the optional asyncssh package.
+
+All connections run as coroutines on one event loop thread instead of one
+thread per connection, so thousands of probes can be in flight at once with
+a few kilobytes of state each. A semaphore bounds how many run concurrently.
+"""
+import asyncio
+import threading
+import time
+
+import probes
+from hostkeys import HostKeyError
+
+# Optional dependency, only needed when probes.transport is "asyncssh"
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+
+class AsyncSSHTransport:
+    """SSH transport running every command on a shared asyncio event loop.
+
+    asyncssh opens the TCP connection, exchanges keys and authenticates in one
+    call, so its records carry a single 'connect' phase instead of tcp/kex/auth.
+    With a HostKeyStore, a host with keys on record is only offered those key
+    types, and the key is checked right after connecting.
+    """
+    name = 'asyncssh'
+
+    def __init__(self, concurrency=500, timeout=5, host_keys=None):
+        if asyncssh is None:
+            raise RuntimeError("The asyncssh transport needs the asyncssh package (pip install asyncssh)")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.host_keys = host_keys
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Commands started and not finished, waiting for the semaphore or running
+        self._in_flight = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='ssh-event-loop', daemon=True)
+        self._thread.start()
+
+    async def _command(self, hostname, username, password, command, port, log_path, max_output, timings):
+        self._in_flight += 1
+        try:
+            return await self._run_command(hostname, username, password, command, port, log_path, max_output,
+                                           timings)
+        finally:
+            self._in_flight -= 1
+
+    async def _run_command(self, hostname, username, password, command, port, log_path, max_output, timings):
+        async with self._semaphore:
+            capture = None
+            phases = {}
+            start_time = time.perf_counter()
+            try:
+                pinned = self.host_keys.key_algorithms(hostname, port) if self.host_keys is not None else ()
+                connection = await asyncio.wait_for(
+                    asyncssh.connect(hostname, port=port, username=username, password=password,
+                                     known_hosts=None, server_host_key_algs=list(pinned) or 'default'),
+                    self.timeout)
+                phases['connect'] = time.perf_counter() - start_time
+                async with connection:
+                    if self.host_keys is not None:
+                        key = connection.get_server_host_key()
+                        self.host_keys.check(hostname, port, key.get_algorithm(), key.public_data)
+                    mark = time.perf_counter()
+                    process = await connection.create_process(command, stderr=asyncssh.STDOUT, encoding=None)
+                    capture = probes.OutputCapture(max_output, log_path)
+                    while True:
+                        data = await process.stdout.read(32768)
+                        if not data:
+                            break
+                        capture.write(data)
+                    capture.close()
+                    phases['exec'] = time.perf_counter() - mark
+                response_time = round((time.perf_counter() - start_time) * 1000, 2)  # Convert to ms
+                return True, capture.text(), response_time, None
+            except (asyncssh.Error, HostKeyError, OSError, asyncio.TimeoutError) as e:
+                return False, str(e) or type(e).__name__, 0, type(e).__name__
+            finally:
+                if timings is not None:
+                    timings.update({name: round(seconds * 1000, 2) for name, seconds in phases.items()})
+                if capture:
+                    capture.close()
+
+    async def _probe(self, server):
+        phases = {}
+        is_success, _, response_time, error = await self._command(
+            server['ip'], server['username'], server['password'], 'hostname',
+            server.get('port', 22), None, probes.DEFAULT_OUTPUT_MAX_BYTES, phases
+        )
+        return probes.probe_record(is_success, response_time, phases), error
+
+    async def _probe_all(self, servers):
+        return await asyncio.gather(*(self._probe(server) for server in servers))
+
+    def run(self, hostname, username, password, command, port=22, log_path=None,
+            max_output=probes.DEFAULT_OUTPUT_MAX_BYTES, timings=None):
+        """Runs one command on the event loop; returns (success, output, response_time_ms, error)."""
+        return asyncio.run_coroutine_threadsafe(
+            self._command(hostname, username, password, command, port, log_path, max_output, timings),
+            self._loop
+        ).result()
+
+    def probe_all(self, servers):
+        """Probes every server concurrently on the event loop; returns (uptime record, error) in order."""
+        return asyncio.run_coroutine_threadsafe(self._probe_all(list(servers)), self._loop).result()
+
+    def stats(self):
+        """Commands in flight and how much of the concurrency limit they use."""
+        in_flight = self._in_flight
+        return {
+            "transport": self.name,
+            "concurrency": self.concurrency,
+            "in_flight": in_flight,
+            "pending": max(0, in_flight - self.concurrency),
+            "utilization": round(min(in_flight, self.concurrency) / self.concurrency, 2)
+        }
+
+    def forget_host_key(self, hostname, port=22):
+        if self.host_keys is not None:
+            self.host_keys.forget(hostname, port)
+
+    def drop_connection(self, hostname, username, password, port=22):
+        # Connections are not kept between commands
+        pass
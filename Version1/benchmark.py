@@ -0,0 +1,157 @@
+"""End-to-end benchmark of the dashboard against a simulated SSH fleet.
+
+For every fleet size a fresh simulator process and a fresh dashboard process
+are started, so results don't leak between sizes. Reports monitoring sweep
+time, API latency percentiles and peak memory of the dashboard process:
+
+    python benchmark.py --sizes 10,100,1000,10000 --latency 5 --json results.json
+
+Run it once per --transport (and --probe-executor) to compare them.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = [
+    '/api/devices',
+    '/api/clients',
+    '/api/uptime',
+    '/api/uptime/{device}',
+    '/api/scheduled-updates',
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(workdir, requests, sweeps):
+    """Runs inside the dashboard process and prints one JSON result line."""
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+    logging.disable(logging.INFO)
+    import app
+
+    result = {'devices': sum(len(c['servers']) for c in app.clients)}
+    sweep_times = []
+    for _ in range(sweeps):
+        start = time.perf_counter()
+        app.monitor_devices()
+        sweep_times.append(time.perf_counter() - start)
+    result['sweep_seconds'] = round(min(sweep_times), 3)
+    result['healthy'] = sum(
+        1 for c in app.clients for s in c['servers'] if s.get('status') == 'healthy')
+
+    client = app.app.test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(b'bench:bench').decode()}
+    first_device = app.clients[0]['servers'][0]['name']
+    result['latency_ms'] = {}
+    for endpoint in ENDPOINTS:
+        url = endpoint.format(device=first_device)
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            response.get_data()
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+        samples.sort()
+        result['latency_ms'][endpoint] = {
+            'p50': round(percentile(samples, 0.50), 2),
+            'p95': round(percentile(samples, 0.95), 2),
+            'p99': round(percentile(samples, 0.99), 2),
+        }
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(result), flush=True)
+
+
+def set_probe_options(config_path, **options):
+    with open(config_path) as f:
+        config = json.load(f)
+    config.setdefault('probes', {}).update(options)
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def run_size(size, args):
+    workdir = tempfile.mkdtemp(prefix=f'dashboard-bench-{size}-')
+    simulator = subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, 'simulator.py'),
+         '--devices', str(size), '--port', '0',
+         '--latency', str(args.latency), '--failure-rate', str(args.failure_rate),
+         '--auth-delay', str(args.auth_delay), '--output-size', str(args.output_size),
+         '--write-config', os.path.join(workdir, 'config', 'config.json')],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        ready = simulator.stdout.readline()
+        if not ready.startswith('READY'):
+            raise RuntimeError("Simulator failed to start")
+        set_probe_options(os.path.join(workdir, 'config', 'config.json'),
+                          transport=args.transport, executor=args.probe_executor)
+        measurement = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--measure', workdir,
+             '--requests', str(args.requests), '--sweeps', str(args.sweeps)],
+            stdout=subprocess.PIPE, text=True, check=True)
+        return json.loads(measurement.stdout.strip().splitlines()[-1])
+    finally:
+        simulator.terminate()
+        simulator.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(results):
+    print(f"{'devices':>8} {'sweep s':>9} {'healthy':>8} {'rss MB':>8}  endpoint latency p50/p95/p99 ms")
+    for result in results:
+        print(f"{result['devices']:>8} {result['sweep_seconds']:>9} {result['healthy']:>8} "
+              f"{result['peak_rss_mb']:>8}")
+        for endpoint, latency in result['latency_ms'].items():
+            print(f"{'':>38}{endpoint:<24} {latency['p50']}/{latency['p95']}/{latency['p99']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard against a simulated fleet")
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--requests', type=int, default=20, help="requests per endpoint")
+    parser.add_argument('--sweeps', type=int, default=1, help="sweeps per size (best is reported)")
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--auth-delay', type=float, default=0)
+    parser.add_argument('--output-size', type=int, default=0)
+    parser.add_argument('--transport', default='paramiko', choices=['paramiko', 'asyncssh'],
+                        help="SSH transport the dashboard probes with")
+    parser.add_argument('--probe-executor', default='inline', choices=['inline', 'process'],
+                        help="run paramiko probes inline or in a process pool")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.requests, args.sweeps)
+        return
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        print(f"Benchmarking {size} devices...", file=sys.stderr, flush=True)
+        results.append(run_size(size, args))
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
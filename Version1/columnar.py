@@ -0,0 +1,87 @@
+"""Compact binary encoding of uptime series for the dashboard charts.
+
+Layout (little-endian):
+
+    b'UPTC' | u32 format version | u32 header length | header JSON | blocks
+
+The header lists the columns, status codes and, per device, its name, record
+count and stats. After it follows one block per device in header order with
+each column stored as a packed typed array (timestamps as float64 epoch ms,
+times as float32 ms, status and the latency anomaly flag as uint8). The
+header and every column are padded to 8 bytes, so the browser can wrap each
+column in a Float64Array / Float32Array / Uint8Array view without copying.
+"""
+import json
+import struct
+import sys
+from array import array
+
+COLUMNAR_MIMETYPE = 'application/vnd.dashboard.uptime-columnar'
+FORMAT_VERSION = 1
+
+STATUS_CODES = ('critical', 'healthy')
+COLUMNS = (
+    ('timestamp', 'float64', 'd'),
+    ('response_time', 'float32', 'f'),
+    ('tcp', 'float32', 'f'),
+    ('kex', 'float32', 'f'),
+    ('auth', 'float32', 'f'),
+    ('exec', 'float32', 'f'),
+    ('status', 'uint8', 'B'),
+    ('anomaly', 'uint8', 'B'),
+)
+PHASES = ('tcp', 'kex', 'auth', 'exec')
+
+
+def _padded(data):
+    return data + b'\0' * (-len(data) % 8)
+
+
+def uptime_columns(samples):
+    """Splits UptimeHistory sample tuples into one list per column."""
+    status_index = {status: code for code, status in enumerate(STATUS_CODES)}
+    nan = float('nan')
+    columns = {
+        'timestamp': [sample[0] * 1000 for sample in samples],
+        'response_time': [sample[2] or 0 for sample in samples],
+        'status': [status_index.get(sample[1], 0) for sample in samples],
+        'anomaly': [1 if sample[4] else 0 for sample in samples],
+    }
+    for phase in PHASES:
+        columns[phase] = [sample[3].get(phase, nan) for sample in samples]
+    return columns
+
+
+def encode_uptime(devices):
+    """Encodes (name, samples, stats) tuples into the binary layout."""
+    header = {
+        'columns': [{'name': name, 'type': type_name} for name, type_name, _ in COLUMNS],
+        'status_codes': list(STATUS_CODES),
+        'devices': [],
+    }
+    blocks = []
+    for name, samples, stats in devices:
+        columns = uptime_columns(samples)
+        for column, _, typecode in COLUMNS:
+            packed = array(typecode, columns[column])
+            if sys.byteorder != 'little':
+                packed.byteswap()
+            blocks.append(_padded(packed.tobytes()))
+        header['devices'].append({'name': name, 'count': len(samples), 'stats': stats})
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    # 12 byte prefix + header must end on an 8 byte boundary
+    header_bytes += b' ' * (-(12 + len(header_bytes)) % 8)
+    prefix = b'UPTC' + struct.pack('<II', FORMAT_VERSION, len(header_bytes))
+    return prefix + header_bytes + b''.join(blocks)
+
+
+def encode_uptime_msgpack(devices, msgpack):
+    """Same columnar structure as MessagePack (needs the optional msgpack module)."""
+    return msgpack.packb({
+        'status_codes': list(STATUS_CODES),
+        'devices': [
+            {'name': name, 'stats': stats, 'columns': uptime_columns(samples)}
+            for name, samples, stats in devices
+        ],
+    })
@@ -0,0 +1,88 @@
+"""Change detection and device diffs for reloading config.json at runtime.
+
+ConfigWatcher notices a changed file from its stat() result alone, so
+polling costs one syscall. diff_devices compares the device lists of two
+configs by device name, which is what all per-device state is keyed by, so
+only added, removed and changed devices need work when a config is applied.
+"""
+import os
+
+from tags import validate_tags
+
+# Fields of a device entry used to open its SSH connection
+CONNECTION_FIELDS = ('ip', 'port', 'username', 'password')
+# Fields the dashboard keeps on a device at runtime; 'status' in config.json
+# is only the initial status
+STATE_FIELDS = ('status', 'response_time', 'latency_anomaly', 'latency_baseline_ms', 'host_key_mismatch')
+
+
+class ConfigWatcher:
+    """Tracks a file's mtime, size and inode."""
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def changed(self):
+        """True once after each change to the file."""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+
+def validate_config(config):
+    """Raises ValueError if the config can't be applied."""
+    if not isinstance(config.get('devices'), list) or not isinstance(config.get('users'), dict):
+        raise ValueError("config needs a 'devices' list and a 'users' object")
+    client_ids = set()
+    names = set()
+    for client in config['devices']:
+        if not isinstance(client.get('id'), int) or client['id'] in client_ids:
+            raise ValueError(f"Client {client.get('name')!r} needs a unique integer id")
+        client_ids.add(client['id'])
+        validate_tags(client.get('tags', []), client.get('name'))
+        for server in client.get('servers', []):
+            missing = [field for field in ('name', 'ip', 'username', 'password') if field not in server]
+            if missing:
+                raise ValueError(f"Device {server.get('name')!r} is missing {', '.join(missing)}")
+            if server['name'] in names:
+                raise ValueError(f"Device name {server['name']!r} is used more than once")
+            names.add(server['name'])
+            validate_tags(server.get('tags', []), server['name'])
+
+
+def _devices(clients):
+    return {server['name']: (client['id'], server) for client in clients for server in client.get('servers', [])}
+
+
+def _settings(server):
+    return {key: value for key, value in server.items() if key not in STATE_FIELDS}
+
+
+def diff_devices(old_clients, new_clients):
+    """Returns (added, removed, changed) device names, each sorted.
+
+    A device is changed if any of its settings or its client differ.
+    """
+    old = _devices(old_clients)
+    new = _devices(new_clients)
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    changed = sorted(
+        name for name in old.keys() & new.keys()
+        if old[name][0] != new[name][0] or _settings(old[name][1]) != _settings(new[name][1])
+    )
+    return added, removed, changed
+
+
+def connection_changed(old_server, new_server):
+    return any(old_server.get(field) != new_server.get(field) for field in CONNECTION_FIELDS)
@@ -0,0 +1,320 @@
+"""Per-device uptime history stored as run-length status intervals.
+
+A device's status rarely changes between probes, so instead of one record
+per probe the status is kept as intervals (state, start, end, count):
+another probe with the same result only moves the end of the last interval
+and bumps its count. Months of availability fit in a handful of intervals,
+and uptime percentages come straight from interval lengths. Response times
+and phase timings go to a separate series that only keeps the most recent
+probes, for the charts.
+
+The history file holds one device per line, so loading it only decodes the
+device names; each device's history is decoded on first use.
+"""
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+DEFAULT_MAX_SAMPLES = 1000
+DEFAULT_RETENTION_DAYS = 90
+
+
+def _epoch(timestamp):
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+def _isoformat(epoch):
+    return datetime.fromtimestamp(epoch).isoformat()
+
+
+class UptimeHistory:
+    """Status intervals plus a bounded response time series for one device.
+
+    Intervals are (state, start, end, count) tuples in epoch seconds, where
+    end is the last probe with that state; an interval lasts until the next
+    one starts. Samples are (timestamp, state, response_time, phases, anomaly)
+    tuples, anomaly being the latency detector's verdict for that probe.
+    frozen() returns a read-only copy that is safe to publish. A history
+    created with lazy() keeps its saved JSON text until it is first used.
+    """
+    __slots__ = ('intervals', 'samples', 'retention', '_raw')
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES, retention_days=DEFAULT_RETENTION_DAYS):
+        self.intervals = []
+        self.samples = deque(maxlen=max_samples)
+        self.retention = retention_days * 86400
+        self._raw = None
+
+    @classmethod
+    def lazy(cls, raw, max_samples=DEFAULT_MAX_SAMPLES, retention_days=DEFAULT_RETENTION_DAYS):
+        """History decoded from its saved JSON text on first use."""
+        history = cls(max_samples, retention_days)
+        history._raw = raw
+        return history
+
+    def _decode(self):
+        # Readers of a published copy may decode it at the same time; each
+        # builds the full history before assigning it, so they only repeat work
+        raw = self._raw
+        if raw is None:
+            return
+        saved = json.loads(raw)
+        max_samples = self.samples.maxlen if isinstance(self.samples, deque) else None
+        retention_days = self.retention / 86400
+        if isinstance(saved, list):
+            decoded = UptimeHistory.from_records(saved, max_samples, retention_days)
+        else:
+            decoded = UptimeHistory.from_dict(saved, max_samples, retention_days)
+        self.intervals = decoded.intervals
+        self.samples = decoded.samples
+        self._raw = None
+
+    def append(self, record):
+        self._decode()
+        timestamp = _epoch(record['timestamp'])
+        state = record['status']
+        if self.intervals and self.intervals[-1][0] == state:
+            _, start, _, count = self.intervals[-1]
+            self.intervals[-1] = (state, start, timestamp, count + 1)
+        else:
+            self.intervals.append((state, timestamp, timestamp, 1))
+            self._expire(timestamp)
+        self.samples.append((timestamp, state, record.get('response_time') or 0, record.get('phases') or {},
+                             bool(record.get('anomaly'))))
+
+    def prepend(self, older):
+        """Puts an older history, such as the saved one, in front of this one."""
+        self._decode()
+        older._decode()
+        first = self.intervals[0][1] if self.intervals else float('inf')
+        intervals = [interval for interval in older.intervals if interval[1] < first]
+        if intervals and self.intervals and intervals[-1][0] == self.intervals[0][0]:
+            state, start, _, count = intervals.pop()
+            _, _, end, newer_count = self.intervals[0]
+            self.intervals[0] = (state, start, end, count + newer_count)
+        self.intervals[:0] = intervals
+        first = self.samples[0][0] if self.samples else float('inf')
+        samples = [sample for sample in older.samples if sample[0] < first] + list(self.samples)
+        self.samples = deque(samples, maxlen=self.samples.maxlen)
+
+    def _expire(self, now):
+        # An interval is over once the next one starts
+        cutoff = now - self.retention
+        expired = 0
+        while expired + 1 < len(self.intervals) and self.intervals[expired + 1][1] <= cutoff:
+            expired += 1
+        if expired:
+            del self.intervals[:expired]
+
+    def frozen(self):
+        copy = UptimeHistory.__new__(UptimeHistory)
+        copy.intervals = tuple(self.intervals)
+        copy.samples = tuple(self.samples)
+        copy.retention = self.retention
+        copy._raw = self._raw
+        return copy
+
+    def __len__(self):
+        self._decode()
+        return sum(interval[3] for interval in self.intervals)
+
+    def samples_since(self, since):
+        """Sample tuples at or after the since datetime, oldest first."""
+        self._decode()
+        since_ts = since.timestamp()
+        samples = []
+        for sample in reversed(self.samples):
+            if sample[0] < since_ts:
+                break
+            samples.append(sample)
+        samples.reverse()
+        return samples
+
+    def records_since(self, since):
+        """Probe records from the response time series at or after the since datetime."""
+        return [
+            {
+                'timestamp': _isoformat(timestamp),
+                'status': state,
+                'response_time': response_time,
+                'phases': phases,
+                'anomaly': anomaly
+            }
+            for timestamp, state, response_time, phases, anomaly in self.samples_since(since)
+        ]
+
+    def _window(self, since_ts):
+        """Yields (state, start, stop, count) clipped to the window, newest first."""
+        next_start = None
+        for state, start, end, count in reversed(self.intervals):
+            stop = next_start if next_start is not None else end
+            next_start = start
+            if stop < since_ts:
+                break
+            if start >= since_ts:
+                yield state, start, stop, count
+            else:
+                # Probes were evenly spread over the interval, so its count is
+                # scaled by the share that falls inside the window
+                share = (stop - since_ts) / (stop - start) if stop > start else 1
+                yield state, since_ts, stop, round(count * share)
+
+    def intervals_since(self, since):
+        """Status intervals overlapping the window, oldest first, as dicts."""
+        self._decode()
+        return [
+            {'state': state, 'start': _isoformat(start), 'end': _isoformat(stop), 'count': count}
+            for state, start, stop, count in reversed(list(self._window(since.timestamp())))
+        ]
+
+    def stats(self, since):
+        """Uptime statistics for the window, weighted by time spent in each state."""
+        self._decode()
+        durations = {}
+        counts = {}
+        for state, start, stop, count in self._window(since.timestamp()):
+            durations[state] = durations.get(state, 0) + stop - start
+            counts[state] = counts.get(state, 0) + count
+        total_checks = sum(counts.values())
+        healthy_checks = counts.get('healthy', 0)
+        total_time = sum(durations.values())
+        if total_time > 0:
+            uptime_percentage = durations.get('healthy', 0) / total_time * 100
+        else:
+            uptime_percentage = (healthy_checks / total_checks) * 100 if total_checks > 0 else 0
+
+        # Average time per SSH phase so slow networks (tcp/kex) can be told
+        # apart from slow sshd (auth/exec)
+        phase_totals = {}
+        phase_counts = {}
+        anomalies = 0
+        since_ts = since.timestamp()
+        for timestamp, _, _, phases, anomaly in reversed(self.samples):
+            if timestamp < since_ts:
+                break
+            anomalies += anomaly
+            for phase, ms in phases.items():
+                phase_totals[phase] = phase_totals.get(phase, 0) + ms
+                phase_counts[phase] = phase_counts.get(phase, 0) + 1
+
+        return {
+            "uptime_percentage": round(uptime_percentage, 2),
+            "downtime_percentage": round(100 - uptime_percentage, 2) if total_checks else 0,
+            "total_checks": total_checks,
+            "healthy_checks": healthy_checks,
+            "critical_checks": total_checks - healthy_checks,
+            "monitored_seconds": round(total_time),
+            "latency_anomalies": anomalies,
+            "avg_phases": {phase: round(phase_totals[phase] / phase_counts[phase], 2) for phase in phase_totals}
+        }
+
+    def to_dict(self):
+        """Serializable form: intervals as lists, the series as delta-encoded columns."""
+        self._decode()
+        timestamps = []
+        previous = 0
+        for timestamp, _, _, _, _ in self.samples:
+            ms = round(timestamp * 1000)
+            timestamps.append(ms - previous)
+            previous = ms
+        phase_names = sorted({phase for _, _, _, phases, _ in self.samples for phase in phases})
+        return {
+            'intervals': [list(interval) for interval in self.intervals],
+            'samples': {
+                'timestamp_delta_ms': timestamps,
+                'status': [state for _, state, _, _, _ in self.samples],
+                'response_time': [response_time for _, _, response_time, _, _ in self.samples],
+                'phases': {
+                    phase: [phases.get(phase) for _, _, _, phases, _ in self.samples] for phase in phase_names
+                },
+                # Anomalies are rare, so only their positions are stored
+                'anomalies': [index for index, sample in enumerate(self.samples) if sample[4]]
+            }
+        }
+
+    def to_json(self):
+        # A history that was never used is written back as it was read
+        if self._raw is not None:
+            return self._raw
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    @classmethod
+    def from_dict(cls, data, max_samples=DEFAULT_MAX_SAMPLES, retention_days=DEFAULT_RETENTION_DAYS):
+        history = cls(max_samples, retention_days)
+        history.intervals = [tuple(interval) for interval in data.get('intervals', [])]
+        samples = data.get('samples', {})
+        phase_columns = samples.get('phases', {})
+        anomalies = set(samples.get('anomalies', []))
+        timestamp = 0
+        for index, delta in enumerate(samples.get('timestamp_delta_ms', [])):
+            timestamp += delta
+            phases = {phase: column[index] for phase, column in phase_columns.items() if column[index] is not None}
+            history.samples.append((timestamp / 1000, samples['status'][index], samples['response_time'][index],
+                                    phases, index in anomalies))
+        if history.intervals:
+            history._expire(time.time())
+        return history
+
+    @classmethod
+    def from_records(cls, records, max_samples=DEFAULT_MAX_SAMPLES, retention_days=DEFAULT_RETENTION_DAYS):
+        """Builds the history from a list of probe records (the old file format)."""
+        history = cls(max_samples, retention_days)
+        for record in records:
+            history.append(record)
+        return history
+
+
+# First line of a file in the one-device-per-line layout. The file as a whole
+# stays a JSON object; the marker is just one more key that isn't a device.
+FORMAT_MARKER = '{"#format":"uptime-lines/1"'
+
+
+def _load_full(f, devices, max_samples, retention_days):
+    histories = {}
+    for device, saved in json.load(f).items():
+        if device in devices:
+            if isinstance(saved, list):
+                histories[device] = UptimeHistory.from_records(saved, max_samples, retention_days)
+            else:
+                histories[device] = UptimeHistory.from_dict(saved, max_samples, retention_days)
+    return histories
+
+
+def load_histories(path, devices, max_samples=DEFAULT_MAX_SAMPLES, retention_days=DEFAULT_RETENTION_DAYS):
+    """Reads the history file; returns {device: UptimeHistory} for the given devices.
+
+    Histories come back lazy. Files without the format marker (written by
+    json.dump before) are decoded in full.
+    """
+    devices = set(devices)
+    histories = {}
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        if f.readline().rstrip('\n') == FORMAT_MARKER:
+            try:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if line == '}':
+                        return histories
+                    device, end = decoder.raw_decode(line, 1)
+                    if device in devices:
+                        histories[device] = UptimeHistory.lazy(line[end + 1:], max_samples, retention_days)
+            except ValueError:
+                pass
+            # Damaged line or no closing brace: let the full decoder report it
+            histories = {}
+        f.seek(0)
+        return _load_full(f, devices, max_samples, retention_days)
+
+
+def save_histories(path, histories):
+    """Writes {device: UptimeHistory} as a JSON object with one device per line."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(FORMAT_MARKER)
+        for device, history in histories.items():
+            f.write(',\n' + json.dumps(device) + ':' + history.to_json())
+        f.write('\n}\n')
+    os.replace(temp_path, path)
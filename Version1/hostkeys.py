@@ -0,0 +1,173 @@
+"""Persistent SSH host key store in OpenSSH known_hosts format.
+
+Probes used to accept whatever key a device presented, so a man in the
+middle went unnoticed. The store is read once into memory: the first key a
+host presents is remembered (trust on first use, or rejected with the
+'strict' policy) and any other key afterwards is a mismatch that fails the
+connection. Known key types are also offered to the server first, so it
+presents the key on record instead of one that would need a second check.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Signature algorithms a server can use with each key type
+KEY_ALGORITHMS = {
+    'ssh-rsa': ('rsa-sha2-512', 'rsa-sha2-256', 'ssh-rsa'),
+}
+
+
+class HostKeyError(Exception):
+    """A host key was not accepted."""
+
+
+class HostKeyMismatch(HostKeyError):
+    """The host presented a different key than the one on record."""
+
+
+class UnknownHostKey(HostKeyError):
+    """The host has no key on record and the policy is 'strict'."""
+
+
+def host_entry(hostname, port):
+    """Host name as written in known_hosts: [host]:port for non-standard ports."""
+    return hostname if port == 22 else f"[{hostname}]:{port}"
+
+
+def _hash_matches(hashed, entry):
+    """Whether a hashed known_hosts name (|1|salt|hash) is the given host entry."""
+    _, _, salt, digest = hashed.split('|', 3)
+    expected = hmac.new(base64.b64decode(salt), entry.encode(), hashlib.sha1).digest()
+    return hmac.compare_digest(base64.b64encode(expected).decode(), digest)
+
+
+def fingerprint(key_blob):
+    return 'SHA256:' + base64.b64encode(hashlib.sha256(key_blob).digest()).decode().rstrip('=')
+
+
+class HostKeyStore:
+    """In-memory known_hosts: host entry -> {key type: base64 key}.
+
+    Hashed entries (|1|salt|hash) are matched when a host is first looked
+    up. New keys are appended to the file, so several processes sharing it
+    only ever add lines.
+    """
+
+    def __init__(self, path='config/known_hosts', policy='tofu'):
+        if policy not in ('tofu', 'strict'):
+            raise ValueError(f"Unknown host key policy {policy!r}")
+        self.path = path
+        self.policy = policy
+        self._keys = {}
+        self._hashed = []
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self._keys = {}
+        self._hashed = []
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                fields = line.split()
+                # Markers (@cert-authority, @revoked) and comments are not used here
+                if len(fields) < 3 or fields[0].startswith(('#', '@')):
+                    continue
+                hosts, key_type, key = fields[:3]
+                if hosts.startswith('|1|'):
+                    self._hashed.append((hosts, key_type, key))
+                    continue
+                for host in hosts.split(','):
+                    self._keys.setdefault(host, {})[key_type] = key
+
+    def _lookup(self, entry):
+        keys = self._keys.get(entry)
+        if keys is None and self._hashed:
+            keys = {}
+            for hashed, key_type, key in self._hashed:
+                if _hash_matches(hashed, entry):
+                    keys[key_type] = key
+            # Cached so hashing happens once per host
+            self._keys[entry] = keys
+        return keys or {}
+
+    def key_algorithms(self, hostname, port):
+        """Host key algorithms for the key types on record, or () for an unknown host."""
+        with self._lock:
+            key_types = list(self._lookup(host_entry(hostname, port)))
+        algorithms = []
+        for key_type in key_types:
+            algorithms.extend(KEY_ALGORITHMS.get(key_type, (key_type,)))
+        return tuple(algorithms)
+
+    def check(self, hostname, port, key_type, key_blob):
+        """Verifies the key a host presented; returns True if it was just added.
+
+        Raises HostKeyMismatch if the host has other keys on record and
+        UnknownHostKey for a new host under the strict policy.
+        """
+        entry = host_entry(hostname, port)
+        key = base64.b64encode(key_blob).decode()
+        with self._lock:
+            keys = self._lookup(entry)
+            if keys.get(key_type) == key:
+                return False
+            if keys:
+                expected = ', '.join(f"{t} {fingerprint(base64.b64decode(k))}" for t, k in keys.items())
+                message = (f"Host key for {entry} changed: got {key_type} {fingerprint(key_blob)}, "
+                           f"expected {expected}")
+                logger.error(message)
+                raise HostKeyMismatch(message)
+            if self.policy == 'strict':
+                raise UnknownHostKey(f"No host key on record for {entry} ({key_type} {fingerprint(key_blob)})")
+            self._keys[entry] = {key_type: key}
+            self._append(f"{entry} {key_type} {key}\n")
+        logger.info(f"Added host key for {entry}: {key_type} {fingerprint(key_blob)}")
+        return True
+
+    def _append(self, line):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One write per line with O_APPEND, so concurrent writers don't interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    def forget(self, hostname, port, rewrite=True):
+        """Drops a host's keys, so the next connection records the key it presents."""
+        entry = host_entry(hostname, port)
+        with self._lock:
+            self._keys.pop(entry, None)
+            self._hashed = [h for h in self._hashed if not _hash_matches(h[0], entry)]
+            if rewrite and os.path.exists(self.path):
+                self._rewrite(entry)
+        logger.info(f"Forgot host key for {entry}")
+
+    def _rewrite(self, entry):
+        kept = []
+        with open(self.path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and not fields[0].startswith(('#', '@')):
+                    hosts = fields[0]
+                    if hosts.startswith('|1|') and _hash_matches(hosts, entry):
+                        continue
+                    if not hosts.startswith('|1|'):
+                        remaining = [h for h in hosts.split(',') if h != entry]
+                        if not remaining:
+                            continue
+                        line = ' '.join([','.join(remaining)] + fields[1:]) + '\n'
+                kept.append(line)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.writelines(kept)
+        os.replace(temp_path, self.path)
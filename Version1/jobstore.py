@@ -0,0 +1,183 @@
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from apscheduler.jobstores.base import BaseJobStore, JobLookupError, ConflictingIdError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from apscheduler.job import Job
+
+
+class SQLiteJobStore(BaseJobStore):
+    """APScheduler job store backed by a local SQLite file (stdlib sqlite3 only).
+
+    Jobs survive restarts, so startup does not have to re-add every pending job.
+    Inside ``batch()`` writes share one transaction, which makes adding
+    thousands of jobs a single commit instead of one per job.
+    """
+
+    def __init__(self, path, tablename='apscheduler_jobs', pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super(SQLiteJobStore, self).__init__()
+        self.path = path
+        self.tablename = tablename
+        self.pickle_protocol = pickle_protocol
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.tablename} ('
+                'id TEXT PRIMARY KEY, next_run_time REAL, job_state BLOB NOT NULL)')
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_{self.tablename}_next_run_time '
+                f'ON {self.tablename} (next_run_time)')
+        return self._conn
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            conn = self._connect()
+            if self._batch_depth:
+                yield conn
+                return
+            conn.execute('BEGIN')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    @contextmanager
+    def batch(self):
+        """Group every write made inside the block into one transaction."""
+        with self._lock:
+            conn = self._connect()
+            if self._batch_depth == 0:
+                conn.execute('BEGIN')
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    conn.execute('ROLLBACK')
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                conn.execute('COMMIT')
+
+    def start(self, scheduler, alias):
+        super(SQLiteJobStore, self).start(scheduler, alias)
+        with self._lock:
+            self._connect()
+
+    def get_job_ids(self):
+        """Return the ids of all stored jobs without unpickling them."""
+        with self._lock:
+            rows = self._connect().execute(f'SELECT id FROM {self.tablename}').fetchall()
+        return {row[0] for row in rows}
+
+    def lookup_job(self, job_id):
+        with self._lock:
+            row = self._connect().execute(
+                f'SELECT job_state FROM {self.tablename} WHERE id = ?', (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        timestamp = datetime_to_utc_timestamp(now)
+        return self._get_jobs('WHERE next_run_time <= ?', (timestamp,))
+
+    def get_next_run_time(self):
+        with self._lock:
+            row = self._connect().execute(
+                f'SELECT next_run_time FROM {self.tablename} WHERE next_run_time IS NOT NULL '
+                'ORDER BY next_run_time LIMIT 1').fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def count_jobs(self):
+        """Number of stored jobs, without loading them."""
+        with self._lock:
+            return self._connect().execute(f'SELECT COUNT(*) FROM {self.tablename}').fetchone()[0]
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        state = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        with self._write() as conn:
+            try:
+                conn.execute(
+                    f'INSERT INTO {self.tablename} (id, next_run_time, job_state) VALUES (?, ?, ?)',
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time), state))
+            except sqlite3.IntegrityError:
+                raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        state = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        with self._write() as conn:
+            cursor = conn.execute(
+                f'UPDATE {self.tablename} SET next_run_time = ?, job_state = ? WHERE id = ?',
+                (datetime_to_utc_timestamp(job.next_run_time), state, job.id))
+            if cursor.rowcount == 0:
+                raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self._write() as conn:
+            cursor = conn.execute(f'DELETE FROM {self.tablename} WHERE id = ?', (job_id,))
+            if cursor.rowcount == 0:
+                raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self._write() as conn:
+            conn.execute(f'DELETE FROM {self.tablename}')
+
+    def shutdown(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where='', params=()):
+        jobs = []
+        failed_job_ids = []
+        with self._lock:
+            rows = self._connect().execute(
+                f'SELECT id, job_state FROM {self.tablename} {where} ORDER BY next_run_time',
+                params).fetchall()
+            for job_id, job_state in rows:
+                try:
+                    jobs.append(self._reconstitute_job(job_state))
+                except BaseException:
+                    self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                    failed_job_ids.append(job_id)
+
+            # Remove all the jobs we failed to restore
+            if failed_job_ids:
+                with self._write() as conn:
+                    conn.executemany(
+                        f'DELETE FROM {self.tablename} WHERE id = ?', [(i,) for i in failed_job_ids])
+        return jobs
+
+    def __repr__(self):
+        return '<%s (path=%s)>' % (self.__class__.__name__, self.path)
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    """Entries flushed together; writers wait until done and see any error."""
+    __slots__ = ('lines', 'done', 'error')
+
+    def __init__(self):
+        self.lines = []
+        self.done = False
+        self.error = None
+
+
+class UpdateJournal:
+    """Write-ahead journal for scheduled update state changes.
+
+    Every change is appended as one JSON line to the journal file. Writers that
+    arrive while another thread is flushing are batched into the next fsync
+    (group commit), so a burst of state changes costs one disk sync. The full
+    list is only rewritten on compaction, via an atomic snapshot replace.
+    A failed write is cut off again and raised to every writer in its batch.
+    """
+
+    def __init__(self, snapshot_path, journal_path, compact_after=1000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_after = compact_after
+        self.entries_since_snapshot = 0
+        self._cond = threading.Condition()
+        self._batch = _Batch()  # entries waiting for the next flush
+        self._flushing = False
+        self._fd = None
+
+    def _open(self):
+        if self._fd is None:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def append(self, entry):
+        """Append one entry and block until it has been fsynced.
+
+        Raises OSError if the entry could not be written.
+        """
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._cond:
+            batch = self._batch
+            batch.lines.append(line)
+            while not batch.done:
+                if not self._flushing:
+                    self._flush_locked()
+                else:
+                    self._cond.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def _flush_locked(self):
+        # Called with the condition held. The lock is released during the
+        # write so new entries can queue up for the next group.
+        batch, self._batch = self._batch, _Batch()
+        self._flushing = True
+        self._cond.release()
+        try:
+            self._write(''.join(batch.lines).encode('utf-8'))
+        except OSError as e:
+            logger.error(f"Error writing update journal: {e}")
+            batch.error = e
+        finally:
+            self._cond.acquire()
+            self._flushing = False
+            batch.done = True
+            if batch.error is None:
+                self.entries_since_snapshot += len(batch.lines)
+            else:
+                # The next successful change writes a full snapshot instead
+                self.entries_since_snapshot = max(self.entries_since_snapshot, self.compact_after)
+            self._cond.notify_all()
+
+    def _write(self, data):
+        fd = self._open()
+        start = os.lseek(fd, 0, os.SEEK_END)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        except OSError:
+            # Cut off a partial write, so later entries don't follow a torn line
+            try:
+                os.ftruncate(fd, start)
+            except OSError:
+                pass
+            self._close()
+            raise
+
+    def put(self, update):
+        self.append({'op': 'put', 'update': update})
+
+    def set(self, update_id, extend=None, **fields):
+        """Journals changed fields; extend maps list fields to (start, items) appended at start."""
+        entry = {'op': 'set', 'id': update_id, 'fields': fields}
+        if extend:
+            # Stored with their position, so replaying an entry twice is harmless
+            entry['extend'] = {name: [start, items] for name, (start, items) in extend.items()}
+        self.append(entry)
+
+    def delete(self, update_id):
+        self.append({'op': 'delete', 'id': update_id})
+
+    def needs_compaction(self):
+        return self.entries_since_snapshot >= self.compact_after
+
+    def snapshot(self, updates):
+        """Atomically write a full snapshot and start an empty journal.
+
+        Journal operations are idempotent, so an entry for a change that is
+        already contained in the snapshot is harmless on replay.
+        """
+        with self._cond:
+            while self._flushing or self._batch.lines:
+                if not self._flushing:
+                    self._flush_locked()
+                else:
+                    self._cond.wait()
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(updates), f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self._close()
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                os.fsync(f.fileno())
+            self.entries_since_snapshot = 0
+
+    def replay(self):
+        """Load the last snapshot and apply the journal on top of it."""
+        updates = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                for update in json.load(f):
+                    updates[update['id']] = update
+
+        applied = 0
+        corrupt = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                lines = f.readlines()
+            offset = 0  # start of the current line
+            for index, line in enumerate(lines):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("no line end")
+                    entry = json.loads(line)
+                except ValueError:
+                    if index == len(lines) - 1:
+                        # A torn final line from a crash mid-write; everything
+                        # before it was fsynced and is kept. It is cut off so
+                        # new entries don't end up glued to it.
+                        logger.warning("Dropping incomplete update journal entry")
+                        with open(self.journal_path, 'r+b') as f:
+                            f.truncate(offset)
+                    else:
+                        # Entries are only appended after fsynced ones, so a
+                        # bad line before the tail means the file is damaged
+                        logger.error(f"Skipping corrupt update journal entry {index + 1}")
+                        corrupt = True
+                    continue
+                finally:
+                    offset += len(line)
+                op = entry.get('op')
+                if op == 'put':
+                    updates[entry['update']['id']] = entry['update']
+                elif op == 'set' and entry['id'] in updates:
+                    update = updates[entry['id']]
+                    for name, (start, items) in entry.get('extend', {}).items():
+                        update[name] = update.get(name, [])[:start] + items
+                    update.update(entry['fields'])
+                elif op == 'delete':
+                    updates.pop(entry['id'], None)
+                applied += 1
+
+        # A damaged journal is replaced by a snapshot of what could be read
+        self.entries_since_snapshot = max(applied, self.compact_after) if corrupt else applied
+        return list(updates.values())
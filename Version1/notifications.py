@@ -0,0 +1,156 @@
+"""Per-recipient batching of email notifications.
+
+Bulk actions and waves of scheduled updates used to send one email per
+event. Events are now buffered per recipient and go out as one digest once
+the oldest has waited `window` seconds, and each recipient gets at most
+`max_per_hour` emails; anything beyond that rolls into the next allowed
+digest. Critical events skip both and are sent right away. Sending happens
+on a background thread, so request handlers never wait for SMTP. A digest
+that fails is retried after the window, at most `max_retries` times in a
+row per recipient before its events are dropped.
+"""
+import logging
+import textwrap
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class _Event:
+    __slots__ = ('created', 'subject', 'body')
+
+    def __init__(self, subject, body):
+        self.created = datetime.now()
+        self.subject = subject
+        self.body = body
+
+
+class NotificationQueue:
+    """Buffers notifications per recipient and sends them via send(to, subject, body)."""
+
+    def __init__(self, send, window=300, max_per_hour=6, max_pending=1000, digest_prefix='Notifications',
+                 max_retries=5):
+        self.send = send
+        self.window = window
+        self.max_per_hour = max_per_hour
+        self.max_pending = max_pending
+        self.digest_prefix = digest_prefix
+        self.max_retries = max_retries
+        self._failures = {}  # recipient -> digests failed in a row
+        self._pending = {}   # recipient -> list of _Event
+        self._since = {}     # recipient -> monotonic time its oldest pending event arrived
+        self._sent = {}      # recipient -> deque of monotonic send times within the last hour
+        self._urgent = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def notify(self, to_email, subject, body, priority='normal'):
+        if not to_email:
+            logger.info(f"Not sending '{subject}': no recipient")
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notifications', daemon=True)
+                self._thread.start()
+            if priority == 'critical':
+                self._urgent.append((to_email, subject, body))
+            else:
+                events = self._pending.setdefault(to_email, [])
+                if not events:
+                    self._since[to_email] = time.monotonic()
+                events.append(_Event(subject, body))
+                self._cap(to_email, events)
+            self._cond.notify()
+
+    def _cap(self, to_email, events):
+        if len(events) > self.max_pending:
+            del events[:len(events) - self.max_pending]
+            logger.warning(f"Dropped old notifications for {to_email}, more than {self.max_pending} pending")
+
+    def pending(self):
+        """Number of buffered events, including critical ones not sent yet."""
+        with self._cond:
+            return len(self._urgent) + sum(len(events) for events in self._pending.values())
+
+    def _next_send_time(self, to_email, now):
+        sent = self._sent.get(to_email)
+        if sent is None:
+            return now
+        while sent and now - sent[0] >= 3600:
+            sent.popleft()
+        if len(sent) < self.max_per_hour:
+            return now
+        return sent[0] + 3600
+
+    def _record_send(self, to_email, now):
+        self._sent.setdefault(to_email, deque()).append(now)
+
+    def _take_due(self, now):
+        """Pops what can be sent now; returns (emails, seconds until the next check)."""
+        emails = []
+        while self._urgent:
+            to_email, subject, body = self._urgent.popleft()
+            self._record_send(to_email, now)
+            emails.append((to_email, subject, body, None))
+        wait = None
+        for to_email in list(self._pending):
+            due = max(self._since[to_email] + self.window, self._next_send_time(to_email, now))
+            if due <= now:
+                events = self._pending.pop(to_email)
+                del self._since[to_email]
+                self._record_send(to_email, now)
+                emails.append((to_email,) + self._digest(events) + (events,))
+            else:
+                wait = due - now if wait is None else min(wait, due - now)
+        return emails, wait
+
+    def _digest(self, events):
+        if len(events) == 1:
+            return events[0].subject, events[0].body
+        subject = f"{self.digest_prefix}: {len(events)} events ({events[0].subject}, ...)"
+        parts = [f"{len(events)} events since {events[0].created:%Y-%m-%d %H:%M}:"]
+        parts += [f"- {event.created:%H:%M:%S} {event.subject}" for event in events]
+        for event in events:
+            parts.append(f"\n=== {event.created:%Y-%m-%d %H:%M:%S} - {event.subject} ===")
+            parts.append(textwrap.dedent(event.body).strip())
+        return subject, '\n'.join(parts)
+
+    def _requeue(self, to_email, events):
+        # Failed digests go back to the front and are retried after the window
+        with self._cond:
+            failures = self._failures[to_email] = self._failures.get(to_email, 0) + 1
+            if failures > self.max_retries:
+                del self._failures[to_email]
+                logger.error(f"Dropped {len(events)} notifications for {to_email} after {failures} failed attempts")
+                return
+            pending = self._pending.setdefault(to_email, [])
+            pending[:0] = events
+            self._cap(to_email, pending)
+            self._since[to_email] = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                emails, wait = self._take_due(time.monotonic())
+                if not emails:
+                    self._cond.wait(timeout=wait)
+                    continue
+            for to_email, subject, body, events in emails:
+                if self.send(to_email, subject, body):
+                    with self._cond:
+                        self._failures.pop(to_email, None)
+                elif events:
+                    self._requeue(to_email, events)
+
+    def flush(self):
+        """Sends everything buffered right away, ignoring windows and rate limits."""
+        with self._cond:
+            pending, self._pending, self._since = self._pending, {}, {}
+            urgent, self._urgent = list(self._urgent), deque()
+        for to_email, subject, body in urgent:
+            self.send(to_email, subject, body)
+        for to_email, events in pending.items():
+            self.send(to_email, *self._digest(events))
@@ -0,0 +1,233 @@
+"""Runs SSH commands in a pool of worker processes.
+
+Paramiko's key exchange and ciphers are CPU heavy and hold the GIL, so
+threads in a single process top out at one core. Each worker process here
+runs a few threads and keeps its own ConnectionPool. Commands are routed to
+a worker by hashing the device, so a device always lands in the same process
+and its open connection is reused for the next command. Probes always open a
+fresh connection: their response time then always includes connecting, and
+a device whose sshd stopped accepting logins isn't reported healthy over an
+old connection.
+
+A result that doesn't arrive within the task timeout, or whose worker
+process died, fails like an unreachable device instead of blocking the
+caller; commands for a dead worker's devices go to the remaining ones.
+"""
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+import probes
+
+
+def _worker_main(tasks, results, threads, max_idle, host_keys):
+    # Ctrl-C is for the parent; daemon workers are terminated when it exits
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pool = probes.ConnectionPool(max_idle)
+    executor = ThreadPoolExecutor(threads)
+
+    def run(task_id, task):
+        timings = {}
+        try:
+            success, output, response_time, error = probes.ssh_command(
+                task['ip'], task['username'], task['password'], task['command'],
+                port=task['port'], log_path=task['log_path'], max_output=task['max_output'],
+                timings=timings, pool=None if task.get('fresh') else pool, host_keys=host_keys
+            )
+        except Exception as e:
+            success, output, response_time, error = False, str(e), 0, type(e).__name__
+        results.put((task_id, (success, output, response_time, error, timings)))
+
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        task_id, task = item
+        if task_id is None:
+            # Control message from the parent
+            action, args = task
+            if action == 'forget_host_key':
+                # The parent already rewrote the file
+                host_keys.forget(*args, rewrite=False)
+            elif action == 'drop_connection':
+                pool.discard(args)
+            continue
+        executor.submit(run, task_id, task)
+    executor.shutdown()
+    pool.close()
+
+
+class ProcessProbePool:
+    """SSH transport running commands in worker processes over pooled connections.
+
+    The processes are forked when the pool is created, so create it before
+    the application starts other threads.
+    """
+    name = 'paramiko-process'
+
+    def __init__(self, processes=None, threads_per_process=4, max_idle=600, host_keys=None, timeout=120):
+        context = multiprocessing.get_context('fork')
+        self._results = context.Queue()
+        self._queues = []
+        self._processes = []
+        for index in range(processes or os.cpu_count() or 1):
+            tasks = context.Queue()
+            process = context.Process(
+                target=_worker_main, args=(tasks, self._results, threads_per_process, max_idle, host_keys),
+                name=f'probe-process-{index}', daemon=True)
+            process.start()
+            self._queues.append(tasks)
+            self._processes.append(process)
+        self.host_keys = host_keys
+        self.threads_per_process = threads_per_process
+        self.timeout = timeout
+        self._pending = {}  # task id -> (future, index of the worker process)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_results, name='probe-pool-results', daemon=True)
+        self._reader.start()
+
+    @property
+    def size(self):
+        return len(self._processes)
+
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        """Worker processes alive and how many of their threads have work."""
+        slots = len(self._processes) * self.threads_per_process
+        pending = len(self._pending)
+        return {
+            "transport": self.name,
+            "processes": len(self._processes),
+            "alive": sum(process.is_alive() for process in self._processes),
+            "slots": slots,
+            "pending": pending,
+            "utilization": round(min(pending, slots) / slots, 2)
+        }
+
+    def _worker_for(self, hostname, username, port):
+        """Index of the process a device is routed to, skipping dead ones; None if all died."""
+        alive = [index for index, process in enumerate(self._processes) if process.is_alive()]
+        if not alive:
+            return None
+        index = zlib.crc32(f"{username}@{hostname}:{port}".encode()) % len(self._processes)
+        return index if index in alive else alive[index % len(alive)]
+
+    def _queue_for(self, hostname, username, port):
+        index = self._worker_for(hostname, username, port)
+        return self._queues[index] if index is not None else None
+
+    def submit(self, hostname, username, password, command, port=22, log_path=None,
+               max_output=probes.DEFAULT_OUTPUT_MAX_BYTES, fresh=False):
+        """Queues a command; the Future resolves to (success, output, response_time_ms, error, timings).
+
+        With fresh the command runs on a new connection instead of a pooled one.
+        """
+        future = Future()
+        index = self._worker_for(hostname, username, port)
+        if index is None:
+            future.set_result((False, "All probe processes died", 0, 'ProbeProcessDied', {}))
+            return future
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = (future, index)
+        future.task_id = task_id
+        self._queues[index].put((task_id, {
+            'ip': hostname, 'username': username, 'password': password, 'command': command,
+            'port': port, 'log_path': log_path, 'max_output': max_output, 'fresh': fresh
+        }))
+        return future
+
+    def _result(self, future):
+        """Waits for a task's result, failing it after timeout seconds without one."""
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self._pending.pop(future.task_id, None)
+            return False, f"No result within {self.timeout}s", 0, 'Timeout', {}
+
+    def run(self, hostname, username, password, command, port=22, log_path=None,
+            max_output=probes.DEFAULT_OUTPUT_MAX_BYTES, timings=None):
+        """Runs one command in a worker process; returns (success, output, response_time_ms, error)."""
+        success, output, response_time, error, phases = self._result(self.submit(
+            hostname, username, password, command, port=port, log_path=log_path, max_output=max_output
+        ))
+        if timings is not None:
+            timings.update(phases)
+        return success, output, response_time, error
+
+    def probe_all(self, servers):
+        """Queues a probe of every server at once; yields (uptime record, error) in order.
+
+        Results are awaited in order, so the timeout applies to the wait for
+        each next result rather than to time spent queued behind others.
+        """
+        futures = [
+            self.submit(server['ip'], server['username'], server['password'], 'hostname',
+                        port=server.get('port', 22), fresh=True)
+            for server in servers
+        ]
+        return (self._probe_result(future) for future in futures)
+
+    def forget_host_key(self, hostname, port=22):
+        """Drops a host's keys here and in the worker process that connects to it."""
+        if self.host_keys is None:
+            return
+        self.host_keys.forget(hostname, port)
+        # Every device on the host may live in a different worker
+        for tasks, process in zip(self._queues, self._processes):
+            if not process.is_alive():
+                continue
+            tasks.put((None, ('forget_host_key', (hostname, port))))
+
+    def drop_connection(self, hostname, username, password, port=22):
+        """Closes the pooled connection of a device in the worker that holds it."""
+        tasks = self._queue_for(hostname, username, port)
+        if tasks is not None:
+            tasks.put((None, ('drop_connection', (hostname, port, username, password))))
+
+    def _probe_result(self, future):
+        success, _, response_time, error, phases = self._result(future)
+        return probes.probe_record(success, response_time, phases), error
+
+    def _fail_dead_workers(self):
+        dead = {index for index, process in enumerate(self._processes) if not process.is_alive()}
+        if not dead:
+            return
+        with self._lock:
+            lost = [task_id for task_id, (_, index) in self._pending.items() if index in dead]
+            futures = [self._pending.pop(task_id)[0] for task_id in lost]
+        for future in futures:
+            future.set_result((False, "Probe process died", 0, 'ProbeProcessDied', {}))
+
+    def _read_results(self):
+        checked = time.monotonic()
+        while True:
+            if time.monotonic() - checked >= 1:
+                self._fail_dead_workers()
+                checked = time.monotonic()
+            try:
+                task_id, result = self._results.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                entry = self._pending.pop(task_id, None)
+            if entry is not None:
+                entry[0].set_result(result)
+
+    def shutdown(self):
+        for tasks in self._queues:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
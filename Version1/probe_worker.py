@@ -0,0 +1,150 @@
+"""Standalone probe worker for the dashboard.
+
+Runs the device monitoring sweep for its shard of the fleet and pushes the
+results to the dashboard's ingest API in batches. The shard comes from a
+consistent hash ring over the workers the dashboard currently knows about,
+so workers can join or leave at any time and only the devices of the
+changed worker move. The dashboard should run with probes.mode "remote":
+
+    python probe_worker.py --dashboard http://dashboard:5000 --worker-id dc1-a
+
+The worker reads the same config.json as the dashboard (it needs the device
+credentials) and picks up device changes to it before each sweep; the
+ingest token comes from probes.ingest_token there or --token /
+PROBE_INGEST_TOKEN.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import time
+import urllib.error
+import urllib.request
+
+import probes
+from config_watch import ConfigWatcher, connection_changed, diff_devices, validate_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('probe_worker')
+
+
+class DashboardClient:
+    """Minimal JSON client for the dashboard's probe ingest API."""
+
+    def __init__(self, base_url, token, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+
+def assigned_servers(clients, workers, worker_id):
+    """(client id, server) pairs this worker owns on the hash ring."""
+    ring = probes.HashRing(workers)
+    return [
+        (client['id'], server)
+        for client in clients
+        for server in client['servers']
+        if ring.node_for(probes.device_key(client['id'], server['name'])) == worker_id
+    ]
+
+
+def run_sweep(dashboard, transport, clients, worker_id, batch_size):
+    """Joins, probes the current shard and pushes the results; returns the interval."""
+    membership = dashboard.post('/api/probes/heartbeat', {'worker_id': worker_id})
+    shard = assigned_servers(clients, membership['workers'], worker_id)
+    logger.info(f"Probing {len(shard)} devices ({len(membership['workers'])} workers)")
+
+    batch = []
+    rejected = 0
+    results = transport.probe_all([server for _, server in shard])
+    for (client_id, server), (record, error) in zip(shard, results):
+        batch.append({'client_id': client_id, 'device': server['name'], 'record': record, 'error': error})
+        if len(batch) >= batch_size:
+            rejected += len(dashboard.post('/api/probes/results', {'worker_id': worker_id, 'results': batch})['rejected'])
+            batch = []
+    if batch:
+        rejected += len(dashboard.post('/api/probes/results', {'worker_id': worker_id, 'results': batch})['rejected'])
+    if rejected:
+        logger.warning(f"Dashboard rejected {rejected} results, is the config in sync?")
+    return membership['interval']
+
+
+def reload_devices(path, clients, transport):
+    """Returns the device list from the config file, closing connections made with old settings."""
+    try:
+        with open(path) as f:
+            config = json.load(f)
+        validate_config(config)
+    except (OSError, ValueError) as e:
+        logger.error(f"Not reloading {path}: {e}")
+        return clients
+    added, removed, changed = diff_devices(clients, config['devices'])
+    old = {server['name']: server for client in clients for server in client['servers']}
+    new = {server['name']: server for client in config['devices'] for server in client['servers']}
+    for name in removed + [name for name in changed if connection_changed(old[name], new[name])]:
+        server = old[name]
+        transport.drop_connection(server['ip'], server['username'], server['password'], server.get('port', 22))
+    logger.info(f"Reloaded {path}: {len(added)} devices added, {len(removed)} removed, {len(changed)} changed")
+    return config['devices']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe a shard of the fleet for the dashboard")
+    parser.add_argument('--dashboard', required=True, help="dashboard base URL")
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument('--config', default='config/config.json')
+    parser.add_argument('--token', default=os.environ.get('PROBE_INGEST_TOKEN'))
+    parser.add_argument('--batch-size', type=int, default=200, help="results per ingest request")
+    parser.add_argument('--transport', default=None, choices=['paramiko', 'asyncssh'],
+                        help="SSH transport (default: probes.transport from the config)")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="spread paramiko probes over this many processes (0: probe in this one)")
+    parser.add_argument('--once', action='store_true', help="run a single sweep and exit")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    probes_config = config.get('probes', {})
+    token = args.token or probes_config.get('ingest_token')
+    if not token:
+        parser.error("no ingest token: set probes.ingest_token or pass --token")
+    dashboard = DashboardClient(args.dashboard, token)
+    transport = probes.create_transport(
+        args.transport or probes_config.get('transport', 'paramiko'),
+        executor='process' if args.processes else 'inline',
+        processes=args.processes,
+        concurrency=probes_config.get('concurrency', 500),
+        known_hosts=probes_config.get('known_hosts', 'config/known_hosts'),
+        host_key_policy=probes_config.get('host_key_policy', 'tofu'),
+        task_timeout=probes_config.get('task_timeout_seconds', 120)
+    )
+
+    interval = probes_config.get('interval_seconds', 300)
+    clients = config['devices']
+    watcher = ConfigWatcher(args.config)
+    while True:
+        started = time.monotonic()
+        if watcher.changed():
+            clients = reload_devices(args.config, clients, transport)
+        try:
+            interval = run_sweep(dashboard, transport, clients, args.worker_id, args.batch_size)
+        except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+            logger.error(f"Error reporting to the dashboard: {e}")
+        if args.once:
+            break
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""SSH probing shared by the dashboard and standalone probe workers."""
+import hashlib
+import os
+import socket
+import threading
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime
+
+from hostkeys import HostKeyError, HostKeyStore
+
+DEFAULT_OUTPUT_MAX_BYTES = 64 * 1024
+
+
+class OutputCapture:
+    """Bounded capture of a command's output stream."""
+
+    def __init__(self, max_bytes, log_path=None):
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.log_path = log_path
+        self.log_file = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            self.log_file = open(log_path, 'wb')
+
+    def write(self, data):
+        self.total += len(data)
+        if self.log_file:
+            self.log_file.write(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+
+    def text(self):
+        omitted = self.total - len(self.head) - len(self.tail)
+        if omitted <= 0:
+            return (bytes(self.head) + bytes(self.tail)).decode(errors='replace')
+        note = f"\n... [{omitted} bytes omitted"
+        note += f", full log: {self.log_path}] ...\n" if self.log_path else "] ...\n"
+        return self.head.decode(errors='replace') + note + self.tail.decode(errors='replace')
+
+
+class ConnectionPool:
+    """Authenticated SSH transports kept open between commands.
+
+    A transport is taken out for exclusive use while a command runs on it and
+    given back afterwards, so concurrent commands never share one. Transports
+    idle for longer than max_idle seconds are closed instead of reused.
+    """
+
+    def __init__(self, max_idle=600):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        with self._lock:
+            entry = self._idle.pop(key, None)
+        if entry is None:
+            return None
+        transport, returned_at = entry
+        if not transport.is_active() or time.monotonic() - returned_at > self.max_idle:
+            transport.close()
+            return None
+        return transport
+
+    def give(self, key, transport):
+        with self._lock:
+            previous = self._idle.get(key)
+            if previous is None:
+                self._idle[key] = (transport, time.monotonic())
+                return
+        transport.close()
+
+    def discard(self, key):
+        """Closes the idle transport for key, e.g. after its credentials changed."""
+        with self._lock:
+            entry = self._idle.pop(key, None)
+        if entry is not None:
+            entry[0].close()
+
+    def __len__(self):
+        return len(self._idle)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for transport, _ in idle.values():
+            transport.close()
+
+
+def _connect(hostname, port, username, password, phase_done, host_keys=None):
+    import paramiko
+    sock = socket.create_connection((hostname, port), timeout=5)
+    phase_done('tcp')
+    transport = paramiko.Transport(sock)
+    try:
+        if host_keys is not None:
+            # Offer the key types on record first, so the host presents the key we know
+            pinned = host_keys.key_algorithms(hostname, port)
+            if pinned:
+                options = transport.get_security_options()
+                options.key_types = [t for t in pinned if t in options.key_types] + \
+                    [t for t in options.key_types if t not in pinned]
+        transport.start_client(timeout=5)
+        if host_keys is not None:
+            key = transport.get_remote_server_key()
+            host_keys.check(hostname, port, key.get_name(), key.asbytes())
+        phase_done('kex')
+        transport.auth_password(username, password)
+        phase_done('auth')
+    except BaseException:
+        transport.close()
+        raise
+    return transport
+
+
+def ssh_command(hostname, username, password, command, port=22, log_path=None,
+                max_output=DEFAULT_OUTPUT_MAX_BYTES, timings=None, pool=None, host_keys=None):
+    """Executes an SSH command; returns (success, output, response_time_ms, error).
+
+    stdout and stderr are read as one stream in chunks; at most max_output
+    bytes are kept in memory. With log_path the complete output is written
+    there. error is the exception class name of a failure, else None. If a
+    timings dict is passed it is filled with the duration in ms of each phase:
+    'tcp' connect, 'kex' key exchange, 'auth' and 'exec'. With a
+    ConnectionPool an open transport is reused, which leaves only 'exec'.
+    With a HostKeyStore the host key is verified on every new connection.
+    """
+    # paramiko takes a while to import, so that waits for the first command
+    import paramiko
+
+    # The connection is built step by step (instead of SSHClient.connect) so
+    # every phase can be timed on its own
+    transport = None
+    capture = None
+    phases = {}
+    key = (hostname, port, username, password)
+    try:
+        start_time = mark = time.perf_counter()
+
+        def phase_done(name):
+            nonlocal mark
+            now = time.perf_counter()
+            phases[name] = now - mark
+            mark = now
+
+        transport = pool.take(key) if pool is not None else None
+        if transport is None:
+            transport = _connect(hostname, port, username, password, phase_done, host_keys)
+            channel = transport.open_session(timeout=5)
+        else:
+            try:
+                channel = transport.open_session(timeout=5)
+            except (paramiko.SSHException, EOFError):
+                # The pooled connection went away, start over on a fresh one
+                transport.close()
+                transport = None
+                start_time = mark = time.perf_counter()
+                transport = _connect(hostname, port, username, password, phase_done, host_keys)
+                channel = transport.open_session(timeout=5)
+        channel.set_combine_stderr(True)
+        channel.exec_command(command)
+        capture = OutputCapture(max_output, log_path)
+        while True:
+            data = channel.recv(32768)
+            if not data:
+                break
+            capture.write(data)
+        capture.close()
+        channel.close()
+        phase_done('exec')
+        response_time = round((time.perf_counter() - start_time) * 1000, 2)  # Convert to ms
+        if pool is not None:
+            pool.give(key, transport)
+            transport = None
+        return True, capture.text(), response_time, None
+    except (paramiko.AuthenticationException, paramiko.SSHException, HostKeyError, socket.timeout, socket.error) as e:
+        return False, str(e), 0, type(e).__name__
+    finally:
+        if timings is not None:
+            timings.update({name: round(seconds * 1000, 2) for name, seconds in phases.items()})
+        if capture:
+            capture.close()
+        if transport:
+            transport.close()
+
+
+def probe_record(is_success, response_time, phases):
+    """Uptime record for one probe that finished just now."""
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'status': 'healthy' if is_success else 'critical',
+        'response_time': response_time,
+        'phases': phases
+    }
+
+
+def probe_server(server, pool=None, host_keys=None):
+    """Checks one server by running 'hostname'; returns (uptime record, error)."""
+    phases = {}
+    is_success, _, response_time, error = ssh_command(
+        server['ip'], server['username'], server['password'], 'hostname',
+        port=server.get('port', 22), timings=phases, pool=pool, host_keys=host_keys
+    )
+    return probe_record(is_success, response_time, phases), error
+
+
+class ParamikoTransport:
+    """Runs SSH commands with paramiko in the calling thread.
+
+    This is the default transport. Every transport has the same methods:
+    run() for one command, probe_all() for a monitoring sweep,
+    forget_host_key() to accept a host's new key, drop_connection() to
+    close a device's pooled connection and stats() for readiness checks.
+    The others are
+    probe_pool.ProcessProbePool and async_probes.AsyncSSHTransport.
+    """
+    name = 'paramiko'
+
+    def __init__(self, pool=None, host_keys=None):
+        self.pool = pool
+        self.host_keys = host_keys
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _counted(self):
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def run(self, hostname, username, password, command, port=22, log_path=None,
+            max_output=DEFAULT_OUTPUT_MAX_BYTES, timings=None):
+        """Same as ssh_command: returns (success, output, response_time_ms, error)."""
+        with self._counted():
+            return ssh_command(hostname, username, password, command, port=port, log_path=log_path,
+                               max_output=max_output, timings=timings, pool=self.pool, host_keys=self.host_keys)
+
+    def _probe(self, server):
+        with self._counted():
+            return probe_server(server, pool=self.pool, host_keys=self.host_keys)
+
+    def probe_all(self, servers):
+        """Yields (uptime record, error) for each server, in order."""
+        return (self._probe(server) for server in servers)
+
+    def stats(self):
+        """Commands running right now and connections kept open."""
+        return {
+            "transport": self.name,
+            "in_flight": self._in_flight,
+            "pooled_connections": len(self.pool) if self.pool is not None else 0
+        }
+
+    def forget_host_key(self, hostname, port=22):
+        if self.host_keys is not None:
+            self.host_keys.forget(hostname, port)
+
+    def drop_connection(self, hostname, username, password, port=22):
+        if self.pool is not None:
+            self.pool.discard((hostname, port, username, password))
+
+
+def create_transport(transport='paramiko', executor='inline', processes=None, threads_per_process=4,
+                     max_idle=600, concurrency=500, known_hosts=None, host_key_policy='tofu', task_timeout=120):
+    """Builds the transport selected in the probes config section.
+
+    known_hosts is the path of the host key store; without it host keys
+    are not checked. task_timeout bounds the wait for a worker process.
+    """
+    host_keys = HostKeyStore(known_hosts, host_key_policy) if known_hosts else None
+    if transport == 'asyncssh':
+        from async_probes import AsyncSSHTransport
+        return AsyncSSHTransport(concurrency=concurrency, host_keys=host_keys)
+    if transport != 'paramiko':
+        raise ValueError(f"Unknown SSH transport {transport!r}")
+    if executor == 'process':
+        from probe_pool import ProcessProbePool
+        return ProcessProbePool(processes=processes, threads_per_process=threads_per_process, max_idle=max_idle,
+                                host_keys=host_keys, timeout=task_timeout)
+    if executor != 'inline':
+        raise ValueError(f"Unknown probe executor {executor!r}")
+    return ParamikoTransport(host_keys=host_keys)
+
+
+def device_key(client_id, server_name):
+    """Key a device is sharded by; the same on the dashboard and every worker."""
+    return f"{client_id}/{server_name}"
+
+
+class HashRing:
+    """Consistent hash ring assigning devices to probe workers.
+
+    Each worker is placed on the ring at many points, so when a worker joins
+    or leaves only the devices next to its points move; the rest of the fleet
+    keeps its worker.
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            index = bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        keep = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def node_for(self, key):
+        if not self._points:
+            return None
+        index = bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
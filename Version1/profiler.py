@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class _ActiveRequest:
+    __slots__ = ('start', 'samples')
+
+    def __init__(self, start):
+        self.start = start
+        self.samples = None
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of requests that run longer than a threshold.
+
+    Requests only register their thread and start time, which costs next to
+    nothing. A background thread wakes up every interval and, for requests
+    already over the threshold, records their current stack. When such a
+    request finishes its samples are written as a collapsed-stack file (one
+    "frame;frame;frame count" line per distinct stack, flamegraph.pl format).
+    """
+
+    def __init__(self, threshold=1.0, interval=0.01, output_dir='profiles'):
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+        self._active = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                    self._thread.start()
+
+    def start_request(self):
+        self._ensure_started()
+        self._active[threading.get_ident()] = _ActiveRequest(time.perf_counter())
+
+    def finish_request(self, name):
+        """Stops tracking the current request; returns the profile path if one was written."""
+        entry = self._active.pop(threading.get_ident(), None)
+        if entry is None or not entry.samples:
+            return None
+        duration = time.perf_counter() - entry.start
+        safe_name = ''.join(ch if ch.isalnum() else '_' for ch in name).strip('_') or 'request'
+        path = os.path.join(
+            self.output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{safe_name}.collapsed")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, 'w') as f:
+                for stack, count in entry.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.warning(f"Slow request {name} took {duration:.2f}s, profile written to {path}")
+        except OSError as e:
+            logger.error(f"Error writing profile for {name}: {e}")
+            return None
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            now = time.perf_counter()
+            slow = [(tid, entry) for tid, entry in list(self._active.items())
+                    if now - entry.start >= self.threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for tid, entry in slow:
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                if entry.samples is None:
+                    entry.samples = Counter()
+                entry.samples[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
@@ -0,0 +1,209 @@
+"""Fake SSH fleet for exercising the dashboard without Docker.
+
+A single paramiko server on localhost impersonates any number of devices. The
+device is picked by the SSH username, so every device in the generated config
+has the same ip/port but its own name and behaviour:
+
+    python simulator.py --devices 1000 --port 2222 --latency 20 --failure-rate 0.01 \
+        --write-config config/sim_config.json
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+SIM_PASSWORD = 'sim'
+# Seconds an idle connection is kept open waiting for another command
+IDLE_TIMEOUT = 600
+
+
+class FakeDevice:
+    """Behaviour of one simulated device (times in milliseconds)."""
+
+    def __init__(self, name, latency=0, failure_rate=0.0, auth_delay=0, output_size=0):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.auth_delay = auth_delay
+        self.output_size = output_size
+
+    def output_for(self, command):
+        if self.output_size:
+            line = f"{self.name}: {command}\n".encode()
+            return (line * (self.output_size // len(line) + 1))[:self.output_size]
+        return f"{self.name}\n".encode()
+
+
+class DeviceServer(paramiko.ServerInterface):
+    """paramiko server side of one connection."""
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.device = None
+        # (channel, command) per exec request; one connection can run many
+        self.commands = queue.Queue()
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        device = self.fleet.devices.get(username)
+        if device is None or password != SIM_PASSWORD:
+            return paramiko.AUTH_FAILED
+        if device.auth_delay:
+            time.sleep(device.auth_delay / 1000)
+        if device.failure_rate and random.random() < device.failure_rate:
+            return paramiko.AUTH_FAILED
+        self.device = device
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self.commands.put((channel, command.decode(errors='replace')))
+        return True
+
+
+class FleetSimulator:
+    """Serves a fleet of FakeDevices on one localhost port."""
+
+    def __init__(self, devices, host='127.0.0.1', port=0, host_key=None):
+        self.devices = {device.name: device for device in devices}
+        self.host = host
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(1024)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, name='fleet-simulator', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.sock.close()
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        transport = paramiko.Transport(conn)
+        try:
+            transport.add_server_key(self.host_key)
+            server = DeviceServer(self)
+            transport.start_server(server=server)
+            # Serve exec requests until the client disconnects (pooled clients
+            # keep the connection open between commands) or stays idle too long
+            idle_since = time.time()
+            while transport.is_active() and time.time() - idle_since < IDLE_TIMEOUT:
+                try:
+                    channel, command = server.commands.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                device = server.device
+                if device.latency:
+                    time.sleep(device.latency / 1000)
+                output = device.output_for(command)
+                for offset in range(0, len(output), 32768):
+                    channel.sendall(output[offset:offset + 32768])
+                channel.send_exit_status(0)
+                channel.close()
+                # Drop the accepted channel from the transport's accept queue
+                transport.accept(timeout=0)
+                idle_since = time.time()
+        except Exception as e:
+            logger.debug(f"Simulated connection ended: {e}")
+        finally:
+            transport.close()
+
+    def config(self, devices_per_client=100):
+        """Returns a dashboard config.json with the fleet split into clients."""
+        names = list(self.devices)
+        clients = []
+        for index in range(0, len(names), devices_per_client):
+            clients.append({
+                "id": len(clients) + 1,
+                "name": f"Sim Client {len(clients) + 1}",
+                "contact_email": "",
+                "servers": [
+                    {"name": name, "ip": self.host, "port": self.port, "username": name,
+                     "password": SIM_PASSWORD, "status": "unknown"}
+                    for name in names[index:index + devices_per_client]
+                ]
+            })
+        return {
+            "smtp": {"server": "localhost", "port": 25, "username": "", "password": ""},
+            "devices": clients,
+            "users": {"bench": "bench"}
+        }
+
+
+def make_fleet(count, latency=0, failure_rate=0.0, auth_delay=0, output_size=0, jitter=0.0):
+    """Builds count devices; jitter spreads latency and auth delay by +/- that fraction."""
+    def spread(value):
+        return value * random.uniform(1 - jitter, 1 + jitter) if jitter else value
+    return [
+        FakeDevice(f"sim-{i:05d}", spread(latency), failure_rate, spread(auth_delay), output_size)
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake SSH device fleet on localhost")
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--latency', type=float, default=0, help="command latency in ms")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of logins that fail")
+    parser.add_argument('--auth-delay', type=float, default=0, help="password check delay in ms")
+    parser.add_argument('--output-size', type=int, default=0, help="bytes of output per command")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--devices-per-client', type=int, default=100)
+    parser.add_argument('--write-config', help="write a matching dashboard config.json here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fleet = make_fleet(args.devices, args.latency, args.failure_rate, args.auth_delay,
+                       args.output_size, args.jitter)
+    simulator = FleetSimulator(fleet, args.host, args.port).start()
+    if args.write_config:
+        directory = os.path.dirname(args.write_config)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.write_config, 'w') as f:
+            json.dump(simulator.config(args.devices_per_client), f, indent=2)
+    # The benchmark waits for this line before it starts measuring
+    print(f"READY {simulator.host} {simulator.port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Mergeable quantile sketches for response time percentiles.
+
+DDSketch maps every value to a logarithmic bin, so any quantile is returned
+within a fixed relative error (1% by default) and two sketches merge by
+adding their bin counts. SketchSeries keeps one sketch per time bucket, so
+percentiles over any window come from merging the buckets it covers instead
+of sorting raw samples.
+"""
+import math
+import threading
+
+
+class DDSketch:
+    """Quantile sketch with relative accuracy guarantees (Masson et al., 2019)."""
+    __slots__ = ('gamma', 'log_gamma', 'bins', 'count', 'zero_count')
+
+    # Values at or below this (failed probes report 0 ms) land in the zero bin
+    MIN_VALUE = 1e-3
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.count = 0
+        self.zero_count = 0
+
+    def add(self, value):
+        if value <= self.MIN_VALUE:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        """Adds another sketch (same accuracy) into this one."""
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += other.count
+        self.zero_count += other.zero_count
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def percentiles(self):
+        """p50/p95/p99 rounded to 0.01 ms, None when empty."""
+        result = {}
+        for name, q in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            value = self.quantile(q)
+            result[name] = round(value, 2) if value is not None else None
+        result['count'] = self.count
+        return result
+
+    def to_list(self):
+        return [self.zero_count, [[key, count] for key, count in self.bins.items()]]
+
+    def load_list(self, data):
+        self.zero_count = data[0]
+        self.bins = {key: count for key, count in data[1]}
+        self.count = self.zero_count + sum(self.bins.values())
+
+
+class SketchSeries:
+    """One DDSketch per fixed time bucket, dropped after the retention period."""
+
+    def __init__(self, bucket_seconds=3600, retention_seconds=72 * 3600, relative_accuracy=0.01):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.relative_accuracy = relative_accuracy
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds * self.bucket_seconds)
+
+    def add(self, timestamp, value):
+        bucket = self._bucket(timestamp)
+        with self._lock:
+            sketch = self.buckets.get(bucket)
+            if sketch is None:
+                sketch = self.buckets[bucket] = DDSketch(self.relative_accuracy)
+                self._expire(bucket)
+            sketch.add(value)
+
+    def _expire(self, now_bucket):
+        cutoff = now_bucket - self.retention_seconds
+        for bucket in [b for b in self.buckets if b < cutoff]:
+            del self.buckets[bucket]
+
+    def merge_into(self, target, since_ts):
+        """Merges the buckets overlapping [since_ts, now) into target."""
+        first = self._bucket(since_ts)
+        with self._lock:
+            for bucket, sketch in self.buckets.items():
+                if bucket >= first:
+                    target.merge(sketch)
+        return target
+
+    def merged(self, since_ts):
+        return self.merge_into(DDSketch(self.relative_accuracy), since_ts)
+
+    def absorb(self, other):
+        """Merges every bucket of another series into this one."""
+        with self._lock:
+            for bucket, sketch in other.buckets.items():
+                target = self.buckets.get(bucket)
+                if target is None:
+                    target = self.buckets[bucket] = DDSketch(self.relative_accuracy)
+                target.merge(sketch)
+
+    def to_dict(self):
+        with self._lock:
+            return {str(bucket): sketch.to_list() for bucket, sketch in self.buckets.items()}
+
+    def load_dict(self, data):
+        with self._lock:
+            for bucket, saved in data.items():
+                sketch = DDSketch(self.relative_accuracy)
+                sketch.load_list(saved)
+                self.buckets[int(bucket)] = sketch
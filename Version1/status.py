@@ -0,0 +1,64 @@
+"""Debounced device status with flap detection.
+
+A single failed probe shouldn't mark a device critical, and a device that
+keeps bouncing between results shouldn't flip its status on every probe.
+Each device runs a small state machine: the status changes after
+down_after consecutive failures or up_after consecutive successes, and a
+device whose recent results change too often is 'flapping' until they
+settle again. Every probe is an O(1) update.
+"""
+from collections import deque
+
+
+class StatusPolicy:
+    """Thresholds shared by all devices' state machines."""
+
+    def __init__(self, down_after=2, up_after=2, flap_window=20, flap_start=0.3, flap_stop=0.1):
+        self.down_after = down_after
+        self.up_after = up_after
+        self.flap_window = flap_window
+        # Share of result changes within the window that starts / ends flapping
+        self.flap_start = flap_start
+        self.flap_stop = flap_stop
+
+
+class StatusTracker:
+    """State machine for one device: unknown, healthy, critical or flapping."""
+    __slots__ = ('policy', 'status', 'last_result', 'streak', 'changes', 'change_count')
+
+    def __init__(self, policy, status='unknown'):
+        self.policy = policy
+        self.status = status
+        self.last_result = None
+        self.streak = 0
+        # Whether each of the last flap_window results differed from the one before
+        self.changes = deque(maxlen=policy.flap_window)
+        self.change_count = 0
+
+    @property
+    def change_rate(self):
+        return self.change_count / self.policy.flap_window
+
+    def observe(self, result):
+        """Feeds one probe result ('healthy' or 'critical'); returns True if the status changed."""
+        changed = self.last_result is not None and result != self.last_result
+        if len(self.changes) == self.changes.maxlen:
+            self.change_count -= self.changes[0]
+        self.changes.append(changed)
+        self.change_count += changed
+        self.streak = 1 if changed or self.last_result is None else self.streak + 1
+        self.last_result = result
+
+        previous = self.status
+        threshold = self.policy.down_after if result == 'critical' else self.policy.up_after
+        if previous == 'unknown':
+            # Nothing to debounce against yet
+            self.status = result
+        elif previous == 'flapping':
+            if self.change_rate <= self.policy.flap_stop and self.streak >= threshold:
+                self.status = result
+        elif self.change_rate >= self.policy.flap_start:
+            self.status = 'flapping'
+        elif result != previous and self.streak >= threshold:
+            self.status = result
+        return self.status != previous
@@ -0,0 +1,148 @@
+"""Device tags and selector expressions over them.
+
+Devices (and clients, for all their devices) carry free-form `tags` in
+config.json, and every device also has the implicit tag `client:<id>`. A
+TagIndex maps each tag to the set of device names carrying it, so a selector
+such as `firewall AND (site:ams OR site:fra) AND NOT decommissioned` is
+resolved with set operations on the matching devices only: intersections
+start from the smallest set and a negated term is subtracted from what the
+rest of the AND clause matched instead of from the whole fleet.
+"""
+import re
+from functools import lru_cache
+
+TAG_PATTERN = re.compile(r'[A-Za-z0-9_.:/-]+')
+KEYWORDS = ('AND', 'OR', 'NOT')
+_TOKEN = re.compile(r'[()]|[^\s()]+')
+
+
+class SelectorError(ValueError):
+    """A selector expression could not be parsed."""
+
+
+def validate_tags(tags, owner):
+    """Raises ValueError unless tags is a list of valid tag names."""
+    if not isinstance(tags, list):
+        raise ValueError(f"Tags of {owner!r} must be a list")
+    for tag in tags:
+        if not isinstance(tag, str) or not TAG_PATTERN.fullmatch(tag) or tag.upper() in KEYWORDS:
+            raise ValueError(f"Invalid tag {tag!r} on {owner!r}")
+        if tag.startswith('client:'):
+            raise ValueError(f"Tag {tag!r} on {owner!r} is reserved, client:<id> tags are implicit")
+
+
+@lru_cache(maxsize=256)
+def parse_selector(selector):
+    """Parses a selector into nested tuples: ('tag', name), ('not', node),
+    ('and', nodes) or ('or', nodes). AND binds tighter than OR.
+    """
+    tokens = _TOKEN.findall(selector)
+    if not tokens:
+        raise SelectorError("Empty selector")
+    position = 0
+
+    def peek():
+        return tokens[position].upper() if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def expression():
+        nodes = [clause()]
+        while peek() == 'OR':
+            take()
+            nodes.append(clause())
+        return nodes[0] if len(nodes) == 1 else ('or', tuple(nodes))
+
+    def clause():
+        nodes = [factor()]
+        while peek() == 'AND':
+            take()
+            nodes.append(factor())
+        return nodes[0] if len(nodes) == 1 else ('and', tuple(nodes))
+
+    def factor():
+        token = peek()
+        if token is None:
+            raise SelectorError("Selector ends unexpectedly")
+        if token == 'NOT':
+            take()
+            return ('not', factor())
+        if token == '(':
+            take()
+            node = expression()
+            if peek() != ')':
+                raise SelectorError("Missing closing parenthesis")
+            take()
+            return node
+        tag = take()
+        if tag.upper() in KEYWORDS or not TAG_PATTERN.fullmatch(tag):
+            raise SelectorError(f"Expected a tag, got {tag!r}")
+        return ('tag', tag)
+
+    node = expression()
+    if position < len(tokens):
+        raise SelectorError(f"Unexpected {tokens[position]!r}")
+    return node
+
+
+class TagIndex:
+    """Inverted index of device tags for one config's device list."""
+
+    def __init__(self, clients):
+        self.clients = {}   # device name -> client id
+        self.devices = {}   # device name -> (client, server) entries it was built from
+        self._order = {}    # device name -> position in config.json
+        self._index = {}    # tag -> set of device names
+        for client in clients:
+            client_tags = [f"client:{client['id']}"] + client.get('tags', [])
+            for server in client.get('servers', []):
+                name = server['name']
+                self.clients[name] = client['id']
+                self.devices[name] = (client, server)
+                self._order[name] = len(self._order)
+                for tag in client_tags + server.get('tags', []):
+                    self._index.setdefault(tag, set()).add(name)
+
+    def tags(self):
+        """Device count per tag."""
+        return {tag: len(names) for tag, names in sorted(self._index.items())}
+
+    def select(self, selector):
+        """Names of the devices matching a selector, in config order.
+
+        Raises SelectorError for an invalid selector; unknown tags match nothing.
+        """
+        return sorted(self._evaluate(parse_selector(selector)), key=self._order.__getitem__)
+
+    def _evaluate(self, node):
+        # Sets returned here may be the index's own, they are never modified
+        kind, operand = node
+        if kind == 'tag':
+            return self._index.get(operand, frozenset())
+        if kind == 'or':
+            result = set()
+            for child in operand:
+                result |= self._evaluate(child)
+            return result
+        if kind == 'not':
+            return self._order.keys() - self._evaluate(operand)
+
+        included = sorted((self._evaluate(child) for child in operand if child[0] != 'not'), key=len)
+        excluded = [child[1] for child in operand if child[0] == 'not']
+        if not included:
+            result = set(self._order)
+        else:
+            result = included[0]
+            for names in included[1:]:
+                if not result:
+                    break
+                result = result & names
+        for child in excluded:
+            if not result:
+                break
+            # Set difference walks whichever side is smaller
+            result = result - self._evaluate(child)
+        return result
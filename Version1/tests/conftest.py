@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app's modules are imported flat from Version1/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
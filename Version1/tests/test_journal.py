@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from journal import UpdateJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return UpdateJournal(str(tmp_path / 'updates.json'), str(tmp_path / 'updates.journal'), compact_after=3)
+
+
+def update(update_id, status='scheduled'):
+    return {'id': update_id, 'status': status}
+
+
+def test_replay_applies_journal_on_snapshot(journal):
+    journal.snapshot([update(1)])
+    journal.put(update(2))
+    journal.set(1, status='completed')
+    journal.delete(2)
+
+    assert journal.replay() == [update(1, 'completed')]
+    assert journal.entries_since_snapshot == 3
+
+
+def test_torn_tail_is_dropped_and_truncated(journal):
+    journal.put(update(1))
+    with open(journal.journal_path, 'a') as f:
+        f.write('{"op":"put","upd')
+
+    assert journal.replay() == [update(1)]
+    with open(journal.journal_path) as f:
+        assert f.read().count('\n') == 1
+
+
+def test_appends_after_torn_first_line_survive_restart(journal):
+    with open(journal.journal_path, 'w') as f:
+        f.write('{"op":"pu')
+
+    assert journal.replay() == []
+    journal.put(update(1))
+    journal.put(update(2))
+
+    restarted = UpdateJournal(journal.snapshot_path, journal.journal_path)
+    assert restarted.replay() == [update(1), update(2)]
+
+
+def test_corrupt_line_inside_journal_forces_snapshot(journal):
+    with open(journal.journal_path, 'w') as f:
+        f.write(json.dumps({'op': 'put', 'update': update(1)}) + '\n')
+        f.write('{"op":"put",\x00\x00\n')
+        f.write(json.dumps({'op': 'put', 'update': update(2)}) + '\n')
+
+    assert journal.replay() == [update(1), update(2)]
+    assert journal.needs_compaction()
+
+
+def test_extend_appends_only_new_items_and_replays_idempotently(journal):
+    journal.put({'id': 1, 'tasks': ['a']})
+    journal.set(1, extend={'tasks': (1, ['b', 'c'])}, status='scheduled')
+    with open(journal.journal_path) as f:
+        assert '"a"' not in f.read().splitlines()[1]
+
+    expected = [{'id': 1, 'tasks': ['a', 'b', 'c'], 'status': 'scheduled'}]
+    assert journal.replay() == expected
+    # A crash between writing a snapshot and emptying the journal replays it again
+    journal.snapshot(expected)
+    journal.set(1, extend={'tasks': (1, ['b', 'c'])}, status='scheduled')
+    assert journal.replay() == expected
+
+
+def test_compaction_writes_snapshot_and_empties_journal(journal):
+    for update_id in range(1, 4):
+        journal.put(update(update_id))
+    assert journal.needs_compaction()
+
+    updates = journal.replay()
+    journal.snapshot(updates)
+
+    assert not journal.needs_compaction()
+    assert os.path.getsize(journal.journal_path) == 0
+    with open(journal.snapshot_path) as f:
+        assert json.load(f) == updates
+    journal.set(2, status='completed')
+    assert UpdateJournal(journal.snapshot_path, journal.journal_path).replay() == [
+        update(1), update(2, 'completed'), update(3)]
+
+
+def test_failed_write_is_raised_and_forces_compaction(journal, monkeypatch):
+    journal.put(update(1))
+
+    def failing_fsync(fd):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(os, 'fsync', failing_fsync)
+    with pytest.raises(OSError):
+        journal.put(update(2))
+    monkeypatch.undo()
+
+    # The next change compacts, and the partial write was cut off again
+    assert journal.needs_compaction()
+    assert journal.replay() == [update(1)]